@@ -0,0 +1,13 @@
+from multiprogressbars.helpers.remote_pool import run_agent
+
+
+if __name__ == "__main__":
+    # Connect this host to a Multibar that was created with a 'remote_address', and run its tasks
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Run tasks for a remote Multibar")
+    parser.add_argument("--host", default='localhost', help="Host the Multibar is listening on")
+    parser.add_argument("--port", type=int, required=True, help="Port the Multibar is listening on")
+    parser.add_argument("--authkey", required=True, help="Shared secret given to the Multibar")
+
+    args = parser.parse_args()
+    run_agent((args.host, args.port), args.authkey.encode())
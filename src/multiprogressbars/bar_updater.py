@@ -1,4 +1,11 @@
-from multiprogressbars.helpers.process_handler import Messages, InterruptTask
+from copy import copy
+from numbers import Real
+from time import perf_counter
+from threading import RLock, Event, Thread, local
+
+from multiprogressbars.helpers.process_handler import InterruptTask
+from multiprogressbars.helpers.protocol import Messages, FrameWriter, read_frame
+from multiprogressbars.helpers.worker_context import get_worker_context
 
 
 class BarUpdater:
@@ -9,53 +16,292 @@ class BarUpdater:
     via a localhost socket with the ProcessHandler QThread that is controlling it.
 
     Argument of the form e.g. 'pbar: BarUpdater = None' must be added to the tasks function header manually.
+
+    It may be used from several threads of the task. For tasks that count their progress on a thread pool,
+    'shared_counter' avoids the threads waiting on each other to report it.
     """
+    min_send_interval = 0.01
+
     def __init__(self):
         self._interruption_requested = False
         self._manually_updating_value = False
+        # sub-bars are numbered from 1 by the task's own (root) BarUpdater, which is bar 0
+        self._bar_index = 0
+        self._task_id = 0
+        self._root = self
+        self._num_subbars = 0
+        # value updates are coalesced, and sent with any name / total updates as one frame per interval
+        self._frame = FrameWriter()
+        self._pending_values = dict()
+        self._last_sent = 0
+        # [next item, stop] of the chunk, if the task is a chunk of a range task
+        self._range = None
+        self._min_split_size = 1
+        self._init_threading()
+
+    def _init_threading(self):
+        # guards the pipe and the queued records, on the root BarUpdater
+        self._lock = RLock()
+        # cleared while the task is paused
+        self._resumed = Event()
+        self._resumed.set()
+        # active SharedCounters of the task, and the thread that sends their values and reads the messages meanwhile
+        self._counters = []
+        self._flusher = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # only a task's own BarUpdater is sent to a worker, where it is the root of its sub-bars
+        for name in ['_root', '_lock', '_resumed', '_counters', '_flusher']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._root = self
+        self._init_threading()
+
+    def _detach(self):
+        """
+        :return: BarUpdater: copy of the task's BarUpdater without its pipe end or queued records,
+            to be sent to a remote agent (which gives it a pipe relaying over its own connection)
+        """
+        detached = copy(self)
+        detached._pipe = None
+        detached._frame = FrameWriter()
+        detached._pending_values = dict()
+        return detached
 
     def __call__(self, iterator, desc=None, total=None):
         """
         Object is callable and yields results of an iterator.
-        Handles updating the value itself each iteration.
+        Handles updating the value itself each iteration: the value is the item yielded if it is a number,
+        otherwise the number of items yielded so far (e.g. for paths or objects).
         :param iterator: 'iterable' object whose values are yielded sequentially
         :param desc: str: description of the progress bar
         :param total: value the progress bar is counting towards
         """
         if desc is not None:
-            self.update_name(desc)
+            self._add_record(Messages.name, desc)
         if total is not None:
-            self.update_total(total)
+            self._add_record(Messages.total, total)
+        self._root._flush()
 
         iterator = iter(iterator)
-        value = 0
+        item, value, count = 0, 0, 0
         try:
             while True:
-                value = next(iterator)
-                yield value
+                item = next(iterator)
+                count += 1
+                yield item
+                value = item if isinstance(item, Real) else count
                 self._update_value(value)
         except StopIteration:
             self._update_value(value)
-            return value
+            self._root._flush()
+            return item
+
+    @property
+    def context(self):
+        """
+        Per-worker context object, shared by all tasks that run on the same worker process.
+        It is passed to the 'initializer' given to the Multibar when the worker starts, and torn down when it exits.
+        """
+        return get_worker_context()
+
+    def add_subbar(self, desc=None, total=None):
+        """
+        Open a child progress bar, shown indented under the task's bar, e.g. to follow one phase of the task.
+        It is used in the same way as the task's BarUpdater, and shares its connection to the ProcessHandler.
+        :param desc: str: description of the child progress bar
+        :param total: value the child progress bar is counting towards
+        :return: BarUpdater
+        """
+        root = self._root
+        root._num_subbars += 1
+        subbar = BarUpdater()
+        subbar._bar_index = root._num_subbars
+        subbar._task_id = root._task_id
+        subbar._root = root
+        subbar._set_pipe(root._pipe)
+        if desc is not None:
+            subbar._add_record(Messages.name, desc)
+        if total is not None:
+            subbar._add_record(Messages.total, total)
+        root._flush()
+        return subbar
+
+    def shared_counter(self, desc=None, total=None):
+        """
+        Counter of this bar's value that can be incremented from many threads of the task at once, e.g. the threads
+        of a ThreadPoolExecutor. Each thread counts on its own, and a background thread sends the sum, so the threads
+        don't wait on each other (nor on the connection to the ProcessHandler) to report progress.
+        Interruption and pause requests are seen by each thread on its next increment.
+        Use it as a context manager, or call its 'close' to send the final value:
+
+            def download(url, counter):
+                ...
+                counter.increment()
+
+            with pbar.shared_counter(total=len(urls)) as counter:
+                with ThreadPoolExecutor(8) as executor:
+                    executor.map(download, urls, repeat(counter))
+
+        :param desc: str: description of the progress bar
+        :param total: value the progress bar is counting towards
+        :return: SharedCounter
+        """
+        if desc is not None:
+            self._add_record(Messages.name, desc)
+        if total is not None:
+            self._add_record(Messages.total, total)
+        # the counter sets the bar's value from now on
+        self._manually_updating_value = True
+        counter = SharedCounter(self)
+        self._root._start_counter(counter)
+        return counter
+
+    def _start_counter(self, counter):
+        with self._lock:
+            self._counters.append(counter)
+            if self._flusher is None:
+                stopped = Event()
+                self._flusher = Thread(target=self._run_flusher, args=(stopped,), daemon=True)
+                self._flusher.stopped = stopped
+                self._flusher.start()
+            self._flush()
+
+    def _stop_counter(self, counter):
+        flusher = None
+        with self._lock:
+            if counter not in self._counters:
+                return
+            self._counters.remove(counter)
+            self._pending_values[counter._bar_index] = counter.value
+            if len(self._counters) == 0:
+                flusher, self._flusher = self._flusher, None
+            try:
+                self._flush()
+            except OSError:
+                pass  # the ProcessHandler has been closed
+        if flusher is not None:
+            flusher.stopped.set()
+            flusher.join()
+
+    def _run_flusher(self, stopped):
+        while not stopped.wait(self.min_send_interval):
+            with self._lock:
+                if stopped.is_set():
+                    return
+                for counter in self._counters:
+                    self._pending_values[counter._bar_index] = counter.value
+                try:
+                    self._flush()
+                    self._read_messages()
+                except (OSError, EOFError):
+                    return  # the ProcessHandler has been closed
+
+    def _finish(self):
+        """
+        Close the SharedCounters still open and send the queued records. Called on the root BarUpdater when the task
+        returns.
+        """
+        for counter in list(self._counters):
+            counter.close()
+        self._flush()
+
+    def _iter_range(self):
+        """
+        Yield the items of the chunk, counting them as the bar's value.
+        The stop of the chunk is moved back when the scheduler splits it (see '_split_range').
+        """
+        start = self._range[0]
+        while self._range[0] < self._range[1]:
+            item = self._range[0]
+            self._range[0] += 1
+            yield item
+            self._handle_update_messages(item + 1 - start)
+        self._handle_update_messages(self._range[0] - start)
+        self._flush()
+
+    def _split_range(self):
+        """
+        Keep the first half of the remaining items of the chunk, and reply with the start of the second half
+        (or -1 if there are too few items left), which the scheduler runs as a new chunk on another worker.
+        """
+        split = -1
+        if self._range is not None:
+            position, stop = self._range
+            if stop - position >= 2 * self._min_split_size:
+                split = position + (stop - position + 1) // 2
+                self._range[1] = split
+        self._add_record(Messages.split, split)
+        self._flush()
 
     def _set_pipe(self, pipe):
         self._pipe = pipe
 
-    def _wait_for_unpause(self):
-        while True:
-            if self._pipe.poll(0.1):
-                message_type, message = self._pipe.recv()
-                if message_type == Messages.pause_request and message == False:
+    def _add_record(self, opcode, value):
+        with self._root._lock:
+            self._root._frame.add(opcode, value, self._task_id, self._bar_index)
+
+    def _flush(self):
+        """
+        Send the queued records and the latest value of each bar as one frame. Called on the root BarUpdater.
+        """
+        with self._lock:
+            for bar_index, value in self._pending_values.items():
+                self._frame.add(Messages.value, value, self._task_id, bar_index)
+            self._pending_values.clear()
+            self._last_sent = perf_counter()
+            if len(self._frame) > 0:
+                self._pipe.send_bytes(self._frame.take())
+
+    def _read_messages(self, timeout=0):
+        """
+        Apply the requests received from the ProcessHandler. Called on the root BarUpdater, by the flusher thread while
+        there are SharedCounters, otherwise by the task's threads.
+        :param timeout: time (s) to wait for a request
+        """
+        with self._lock:
+            if not self._pipe.poll(timeout):
+                return
+            while True:
+                for opcode, _, _, value in read_frame(self._pipe.recv_bytes()):
+                    if opcode == Messages.interruption_request and value:
+                        self._interruption_requested = True
+                    if opcode == Messages.pause_request:
+                        if value:
+                            self._resumed.clear()
+                        else:
+                            self._resumed.set()
+                    if opcode == Messages.split_request:
+                        self._split_range()
+                if not self._pipe.poll():
                     return
 
+    def _check_messages(self):
+        """
+        Raise InterruptTask if the task has been interrupted, or wait while it is paused. Called on the root BarUpdater.
+        """
+        if self._flusher is None:
+            self._read_messages()
+        while not self._interruption_requested and not self._resumed.is_set():
+            if self._flusher is None:
+                self._read_messages(0.1)
+            else:
+                self._resumed.wait(0.1)
+        if self._interruption_requested:
+            raise InterruptTask
+
     def _handle_update_messages(self, value):
-        self._pipe.send((Messages.value, value))
-        if self._pipe.poll():
-            message_type, message = self._pipe.recv()
-            if message_type == Messages.interruption_request and message == True:
-                raise InterruptTask
-            if message_type == Messages.pause_request and message == True:
-                self._wait_for_unpause()
+        root = self._root
+        with root._lock:
+            root._pending_values[self._bar_index] = value
+            if perf_counter() - root._last_sent < self.min_send_interval:
+                return
+            root._flush()
+        root._check_messages()
 
     def _update_value(self, value):
         if not self._manually_updating_value:
@@ -65,6 +311,7 @@ class BarUpdater:
         """
         Manually update the progress bar value to the given 'value'.
         This permanently overrides the automatic way for this instance, if it was called by wrapping an iterator.
+        Updates are coalesced, and sent at most every 'min_send_interval' seconds (and when the task returns).
         :param value: update progress bar to 'value' (not by, i.e. not an increment)
         """
         self._manually_updating_value = True
@@ -74,10 +321,65 @@ class BarUpdater:
         """
         Manually set the name / description of the progress bar
         """
-        self._pipe.send((Messages.name, name))
+        self._add_record(Messages.name, name)
+        self._root._flush()
 
     def update_total(self, total):
         """
         Manually set the total (maximum value of) the progress bar
         """
-        self._pipe.send((Messages.total, total))
+        self._add_record(Messages.total, total)
+        self._root._flush()
+
+
+class SharedCounter:
+    """
+    Value of a progress bar counted by many threads at once (see BarUpdater.shared_counter).
+    Each thread adds to its own cell, without locking, and the flusher thread of the task's BarUpdater sends the sum of
+    the cells every 'min_send_interval' seconds.
+    """
+    def __init__(self, pbar):
+        self._root = pbar._root
+        self._bar_index = pbar._bar_index
+        # one [count] per thread that has incremented the counter, only ever written by that thread
+        self._cells = []
+        self._local = local()
+
+    def __call__(self, iterator):
+        """
+        Yield the values of 'iterator', incrementing the counter after each one.
+        For a thread that works through its own share of the items.
+        """
+        for value in iterator:
+            yield value
+            self.increment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def value(self):
+        return sum(cell[0] for cell in self._cells[:])
+
+    def increment(self, n=1):
+        """
+        Add 'n' to the bar's value. Raises InterruptTask if the task has been interrupted, and waits while it is paused.
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._local.cell = [0]
+            self._cells.append(cell)
+        cell[0] += n
+        root = self._root
+        if root._interruption_requested or not root._resumed.is_set():
+            root._check_messages()
+
+    def close(self):
+        """
+        Send the final value, and stop the flusher thread if this is the last open counter of the task.
+        """
+        self._root._stop_counter(self)
@@ -1,4 +1,7 @@
+from multiprocessing import Process
+
 from multiprogressbars.multibar import Multibar
+from multiprogressbars.agent import run_agent
 from multiprogressbars.helpers.util import wrapped_timer, get_rand_string, get_rand_count
 from multiprogressbars.bar_updater import BarUpdater
 
@@ -93,13 +96,62 @@ def run_example_exceptions(
     run_test_mbar(name_list, iters_lb, iters_ub, inner_loop_lb, inner_loop_ub, exception_test)
 
 
+def run_example_remote(
+        num_agents=3,
+        num_tasks=12,
+        port=6020,
+        iters_lb=10,
+        iters_ub=100,
+        inner_loop_lb=1e5,
+        inner_loop_ub=1e6
+):
+    """
+    Start and monitor a number of tasks that are run by worker agents connecting over localhost.
+    The agents are started as local processes here, but could equally be run on other hosts with:
+    'python -m multiprogressbars.agent --host <host> --port <port> --authkey <authkey>'
+
+    :param num_agents: worker agents to start (each runs one task at a time)
+    :param num_tasks: tasks to run (bars displayed)
+    :param port: localhost port the Multibar listens on for agents
+    :param iters_lb: lower bound for outer loop range
+    :param iters_ub: upper bound for outer loop range
+    :param inner_loop_lb: lower bound for inner loop range
+    :param inner_loop_ub: upper bound for inner loop range
+    :return:
+    """
+    address, authkey = ('localhost', port), b'multiprogressbars-example'
+    mbar = Multibar(batch_size=num_agents, remote_address=address, authkey=authkey)
+
+    agents = [Process(target=run_agent, args=(address, authkey), daemon=True) for _ in range(num_agents)]
+    for agent in agents:
+        agent.start()
+
+    for _ in range(num_tasks):
+        name = get_rand_string(8, 32)
+        mbar.add_task(
+            func=slow_loop_test,
+            func_args=(name, get_rand_count(iters_lb, iters_ub),),
+            func_kwargs={'count_inner': get_rand_count(inner_loop_lb, inner_loop_ub)}
+        )
+    print(mbar.get())
+
+    # closing the Multibar disconnects the agents, which then exit
+    mbar.close()
+    for agent in agents:
+        agent.join()
+
+
 if __name__ == "__main__":
     # Parse cmd args, if any
     from argparse import ArgumentParser
     parser = ArgumentParser(description="Arguments for running example")
     parser.add_argument("--with_exceptions", action='store_true', help="Run example generating example exceptions", required=False)
+    parser.add_argument("--remote", action='store_true', help="Run example with worker agents over localhost", required=False)
 
     args = parser.parse_args()
+    if args.remote:
+        run_example_remote()
+        exit()
     if args.with_exceptions:
         example_func = exception_test
     else:
@@ -0,0 +1,143 @@
+import os
+from glob import glob
+from multiprocessing import Array
+
+NODE_DIR = '/sys/devices/system/node'
+
+
+def parse_cpulist(text):
+    """
+    :param text: list of cpus in the kernel's format, e.g. '0-3,8-11'
+    :return: list[int]
+    """
+    cpus = []
+    for part in text.strip().split(','):
+        if part == '':
+            continue
+        first, _, last = part.partition('-')
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def format_cpulist(cpus):
+    """
+    :return: str: the cpus in the kernel's format, e.g. '0-3,8'
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if len(ranges) > 0 and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{first}-{last}' if first != last else f'{first}' for first, last in ranges)
+
+
+def get_numa_nodes(cpus):
+    """
+    :param cpus: the cpus to group
+    :return: dict[node, list[int]]: the given cpus of each NUMA node (one node with all of them if not known)
+    """
+    nodes = dict()
+    for path in glob(os.path.join(NODE_DIR, 'node[0-9]*', 'cpulist')):
+        node = int(os.path.basename(os.path.dirname(path))[len('node'):])
+        with open(path) as f:
+            node_cpus = [cpu for cpu in parse_cpulist(f.read()) if cpu in cpus]
+        if len(node_cpus) > 0:
+            nodes[node] = node_cpus
+    if len(nodes) == 0:
+        nodes[0] = sorted(cpus)
+    return nodes
+
+
+class CorePlacement:
+    """
+    Pins each worker process of a pool to its own core, in an order given by a policy:
+        'compact' fills the cores of one NUMA node (socket) before the next, keeping workers close to shared memory,
+        'spread' takes a core of each node in turn, for the memory bandwidth of every node,
+        or an explicit list of cores.
+    The order is also the order of preference when the number of running tasks changes: the tasks on the last cores
+    are the first to be put on hold, and tasks on the first cores the first to be resumed.
+    Workers claim a core when they start, from a table of the pid holding each core. A core held by a worker that
+    has exited, however it exited (recycled by 'maxtasksperchild', or killed after a timeout), is free again, so the
+    worker replacing it is pinned to the same core.
+    """
+    Compact = 'compact'
+    Spread = 'spread'
+
+    def __init__(self, policy, num_workers):
+        if not hasattr(os, 'sched_setaffinity'):
+            raise ValueError('Pinning workers to cores is only supported on Linux')
+        available = os.sched_getaffinity(0)
+        nodes = get_numa_nodes(available)
+        if policy == self.Compact:
+            cores = [cpu for node in sorted(nodes) for cpu in nodes[node]]
+        elif policy == self.Spread:
+            cores = []
+            node_cpus = [list(nodes[node]) for node in sorted(nodes)]
+            while any(len(cpus) > 0 for cpus in node_cpus):
+                cores.extend(cpus.pop(0) for cpus in node_cpus if len(cpus) > 0)
+        elif isinstance(policy, (list, tuple)):
+            cores = [int(cpu) for cpu in policy]
+            unavailable = [cpu for cpu in cores if cpu not in available]
+            if len(unavailable) > 0:
+                raise ValueError(f'Cores not available to this process: {unavailable}')
+        else:
+            raise ValueError(f'Unknown affinity policy: {policy}')
+        if len(cores) == 0:
+            raise ValueError('No cores to pin the workers to')
+
+        self.nodes = nodes
+        # with more workers than cores, the cores are shared in turn
+        self.cores = [cores[i % len(cores)] for i in range(num_workers)]
+        # pid of the worker holding each of the cores, 0 if none
+        self.owners = Array('i', num_workers)
+
+    def claim_core(self):
+        """
+        Called by a worker when it starts.
+        :return: int: the first core not held by a live worker, or None if there is none
+        """
+        with self.owners.get_lock():
+            for i, owner in enumerate(self.owners):
+                # the pool reaps an exited worker before starting its replacement, so its pid is no longer in use
+                if owner == 0 or not is_alive(owner):
+                    self.owners[i] = os.getpid()
+                    return self.cores[i]
+        return None
+
+    def rank(self, core):
+        """
+        :return: int: position of the core in the order of preference (cores not known to the placement last)
+        """
+        return self.cores.index(core) if core in self.cores else len(self.cores)
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # a process of another user
+    return True
+
+
+_worker_core = None
+
+
+def pin_worker(placement):
+    """
+    Pool initializer: pin the worker process to the first free core of the placement.
+    The worker is left unpinned if every core is held (which should not happen, as there is a core per worker).
+    """
+    global _worker_core
+    _worker_core = placement.claim_core()
+    if _worker_core is not None:
+        os.sched_setaffinity(0, {_worker_core})
+
+
+def get_worker_core():
+    """
+    :return: int: the core the worker is pinned to, or None if it is not pinned
+    """
+    return _worker_core
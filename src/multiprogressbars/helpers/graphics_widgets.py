@@ -1,37 +1,49 @@
-from time import time
 from datetime import timedelta
 from os import cpu_count
 from functools import partial
 
 from PyQt5 import QtWidgets, QtCore, QtGui
 
+from multiprogressbars.helpers.affinity import format_cpulist
+from multiprogressbars.helpers.task_store import TaskStore
+
 
 class LabeledProgressBar(QtWidgets.QProgressBar):
+    """
+    Bar and labels of a task. Its value, total, rate and remaining time are read from the row 'pid' of the 'store' of
+    the MultibarCore, which the core updates before setting the bar. A bar without a store (e.g. a sub-bar, or a bar
+    of a viewer) keeps them in a store of its own, which it updates itself.
+    """
     createMenuSignal = QtCore.pyqtSignal(int, object, bool)
     unit_conv = {3: 'k', 6: 'M', 9: 'G', 12: 'T'}
 
     StateException = 'Failed'
     StateCancelled = 'Cancelled'
-    colors = {StateException: QtGui.QColor(230, 15, 30), StateCancelled: QtGui.QColor(30, 30, 30, 50)}
+    StateDependencyFailed = 'Dependency failed'
+    StateTimedOut = 'Timed out'
+    colors = {StateException: QtGui.QColor(230, 15, 30), StateCancelled: QtGui.QColor(30, 30, 30, 50),
+              StateDependencyFailed: QtGui.QColor(230, 120, 15), StateTimedOut: QtGui.QColor(150, 40, 200)}
 
-    def __init__(self, total=100, name=" ", units_symbol="", max_update_freq=0.02, pid=None, parent=None):
+    def __init__(self, total=100, name=" ", units_symbol="", max_update_freq=0.02, pid=None, parent=None, store=None):
         super(LabeledProgressBar, self).__init__(parent)
-        self.total = total
         self.units_symbol = units_symbol
         self.pid = pid
         self.paused = False
 
+        self.owns_store = store is None
+        if self.owns_store:
+            self.store = TaskStore(max_update_freq)
+            self.row = self.store.add(total)
+            self.store.set_state(self.row, TaskStore.RUNNING)
+        else:
+            self.store = store
+            self.row = pid
+
         self.task_name = f"{name}"
         self.full_name = self.get_full_name(self.task_name)  # with 'Task {pid}: ' prefix
 
-        self.min_update_increment = total // 500
         self.max_update_frequency = max_update_freq
 
-        self.last_updated = self.get_time()
-        self.recent_iteration_speeds = []
-        self.elapsed_time = 0
-        self.remaining_time = 0
-
         self.total_str = self.get_formatted_number(total, self.units_symbol)
         self.progress_str = self.get_progress_str(0)
         self.frequency_str = self.get_frequency_str()
@@ -46,17 +58,68 @@ class LabeledProgressBar(QtWidgets.QProgressBar):
 
         self.label_widgets = [self.prefix_label, self.progress_label, self.frequency_label,
                               self.elapsed_time_label, self.remaining_time_label]
+        self.sub_bar_panel = None
+        self.layout_row = None
+        # the labels of a bar scrolled out of view are only formatted once it is scrolled back into view
+        self.in_view = True
+        self.labels_outdated = False
         self.setEnabled(True)
         for w in self.label_widgets:
             w.setEnabled(True)
 
         self.setBaseSize(200, 20)
-        self.setRange(0, total)
+        self.setRange(0, int(total))
         self.setMouseTracking(False)
         self.setTextVisible(False)
 
         self.show()
 
+    @property
+    def total(self):
+        return self.store.total[self.row]
+
+    @property
+    def current_value(self):
+        return self.store.value[self.row]
+
+    def add_to_layout(self, layout, task_row):
+        # each task takes two grid rows: its own bar, then the panel holding its sub-bars (empty rows take no space)
+        self.layout_row = row = 2 * task_row
+        layout.addWidget(self.prefix_label, row, 0)
+        layout.addWidget(self, row, 1)
+        layout.addWidget(self.progress_label, row, 2, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(self.frequency_label, row, 3, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(self.elapsed_time_label, row, 4, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+        layout.addWidget(self.remaining_time_label, row, 5, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+
+    def remove_from_layout(self, layout):
+        widgets = [self] + self.label_widgets
+        if self.sub_bar_panel is not None:
+            widgets.append(self.sub_bar_panel)
+        for w in widgets:
+            layout.removeWidget(w)
+            w.deleteLater()
+
+    def get_sub_bar(self, layout, index):
+        """
+        Get the child bar 'index' of this task, creating it (and the panel under this bar) when first used.
+        """
+        if self.sub_bar_panel is None:
+            self.sub_bar_panel = SubBarPanel(parent=self.parentWidget())
+            self.sub_bar_panel.set_in_view(self.in_view)
+            layout.addWidget(self.sub_bar_panel, self.layout_row + 1, 0, 1, 6)
+        if index not in self.sub_bar_panel.pbars:
+            self.sub_bar_panel.add_pbar(index, SubProgressBar(
+                pid=self.pid, max_update_freq=self.max_update_frequency, parent=self.sub_bar_panel))
+        return self.sub_bar_panel.pbars[index]
+
+    def has_sub_bars(self):
+        return self.sub_bar_panel is not None
+
+    def toggle_sub_bars(self):
+        if self.sub_bar_panel is not None:
+            self.sub_bar_panel.set_collapsed(not self.sub_bar_panel.collapsed)
+
     def mousePressEvent(self, a0: QtGui.QMouseEvent):
         if a0.button() == QtCore.Qt.MouseButton.RightButton:
             pos = a0.globalPos()
@@ -70,6 +133,16 @@ class LabeledProgressBar(QtWidgets.QProgressBar):
             w.setPalette(palette)
             w.setEnabled(False)
 
+    def set_waiting_on(self, pids):
+        """
+        Show the tasks that must finish before this task can start (replaced by the remaining time once it starts)
+        """
+        if len(pids) == 0:
+            self.remaining_time_label.setText(self.remaining_time_str)
+            return
+        waiting_on = ', '.join(str(pid) for pid in pids[:3]) + (', ...' if len(pids) > 3 else '')
+        self.remaining_time_label.setText(f'  waiting on {waiting_on}')
+
     def set_max_update_frequency(self, value):
         self.max_update_frequency = value
 
@@ -101,47 +174,42 @@ class LabeledProgressBar(QtWidgets.QProgressBar):
 
     def get_frequency_str(self):
         its_suffix = 'it/s'
-        self.mean_speed = 1
-
-        if len(self.recent_iteration_speeds) == 0:
+        rate = self.store.rate[self.row]
+        if rate == 0:
             return f'  {its_suffix}'
-
-        self.recent_iteration_speeds = self.recent_iteration_speeds[-10:]
-        self.mean_speed = round(sum(self.recent_iteration_speeds) / len(self.recent_iteration_speeds), 1)
-        return f'  {self.mean_speed} {its_suffix}'
+        return f'  {round(rate, 1)} {its_suffix}'
 
     def get_elapsed_time_str(self):
-        return f'  {timedelta(seconds=round(self.elapsed_time))}'
+        return f'  {timedelta(seconds=round(self.store.get_elapsed_time(self.row)))}'
 
     def get_remaining_time_str(self):
-        its_remaining = self.total - self.value()
-        if self.mean_speed == 0:
-            self.remaining_time = 0
-        else:
-            self.remaining_time = its_remaining / self.mean_speed
-        return f'  {timedelta(seconds=round(self.remaining_time))}'
-
-    @staticmethod
-    def get_time():
-        return time()
+        # as of the last update, so that labels formatted late (see 'set_in_view') show the same
+        remaining_time = self.store.get_remaining_time(self.row, self.store.last_updated[self.row])
+        return f'  {timedelta(seconds=round(remaining_time))}'
 
     def allowed_to_set_value(self, value):
-        freq_cond = self.get_time() - self.last_updated >= self.max_update_frequency
-        value_cond = value - self.value() >= self.min_update_increment
-        return freq_cond and value_cond
+        return self.store.allowed_to_set_value(self.row, value)
 
     def set_value(self, value):
-        value_difference = value - self.value()
-        self.setValue(value)
-
-        update_time = self.get_time()
-        time_difference = update_time - self.last_updated
-        self.last_updated = update_time
-        self.elapsed_time += time_difference
-
-        if time_difference > 0:
-            self.recent_iteration_speeds.append(value_difference / time_difference)
+        if self.owns_store:
+            self.store.set_value(self.row, value)
+        self.setValue(int(value))
 
+        if self.in_view:
+            self.update_labels()
+        else:
+            self.labels_outdated = True
+
+    def set_in_view(self, in_view):
+        self.in_view = in_view
+        if in_view and self.labels_outdated:
+            self.update_labels()
+        if self.sub_bar_panel is not None:
+            self.sub_bar_panel.set_in_view(in_view)
+
+    def update_labels(self):
+        self.labels_outdated = False
+        self.total_str = self.get_formatted_number(self.total, self.units_symbol)
         self.frequency_str = self.get_frequency_str()
         self.frequency_label.setText(self.frequency_str)
 
@@ -151,7 +219,7 @@ class LabeledProgressBar(QtWidgets.QProgressBar):
         self.remaining_time_str = self.get_remaining_time_str()
         self.remaining_time_label.setText(self.remaining_time_str)
 
-        self.progress_str = self.get_progress_str(value)
+        self.progress_str = self.get_progress_str(self.current_value)
         self.progress_label.setText(self.progress_str)
 
     def get_full_name(self, name):
@@ -166,14 +234,60 @@ class LabeledProgressBar(QtWidgets.QProgressBar):
         self.prefix_label.setText(self.full_name)
 
     def set_total(self, total):
-        self.total = total
+        if self.owns_store:
+            self.store.set_total(self.row, total)
         progress = self.value()
-        self.setRange(progress, self.total)
+        self.setRange(progress, int(total))
+        if not self.in_view:
+            self.labels_outdated = True
+            return
         self.total_str = self.get_formatted_number(total, self.units_symbol)
         self.progress_str = self.get_progress_str(progress)
         self.progress_label.setText(self.progress_str)
 
 
+class SubProgressBar(LabeledProgressBar):
+    """
+    Child progress bar of a task, e.g. for one phase of the task. Right clicking opens the menu of its task.
+    """
+    def get_full_name(self, name):
+        return f"\u21b3 {name}"
+
+
+class SubBarPanel(QtWidgets.QWidget):
+    """
+    Collapsible panel placed under a task's bar, holding the task's sub-bars indented by 'indent' pixels.
+    The sub-bars are formatted only while their task's bar is in view and the panel is not collapsed.
+    """
+    def __init__(self, indent=20, parent=None):
+        super(SubBarPanel, self).__init__(parent)
+        self.layout = QtWidgets.QGridLayout()
+        self.layout.setContentsMargins(indent, 0, 0, 0)
+        self.setLayout(self.layout)
+        self.pbars = dict()
+        self.in_view = True
+        self.collapsed = False
+
+    def set_in_view(self, in_view):
+        self.in_view = in_view
+        for pbar in self.pbars.values():
+            pbar.set_in_view(in_view and not self.collapsed)
+
+    def set_collapsed(self, collapsed):
+        self.collapsed = collapsed
+        self.setVisible(not collapsed)
+        self.set_in_view(self.in_view)
+
+    def add_pbar(self, index, pbar):
+        self.pbars[index] = pbar
+        pbar.set_in_view(self.in_view and not self.collapsed)
+        row = len(self.pbars) - 1
+        self.layout.addWidget(pbar.prefix_label, row, 0)
+        self.layout.addWidget(pbar, row, 1)
+        for col, w in enumerate(pbar.label_widgets[1:]):
+            self.layout.addWidget(w, row, col + 2, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
+
+
 class ZoomingScrollArea(QtWidgets.QScrollArea):
     adjustFontSignal = QtCore.pyqtSignal(object)
     pauseAllSignal = QtCore.pyqtSignal()
@@ -189,9 +303,106 @@ class ZoomingScrollArea(QtWidgets.QScrollArea):
         self.fontname = fontname
         self.fontsize = fontsize
 
+        # bars in layout order, and those currently within (or near) the viewport
+        self.tracked_bars = []
+        self.bars_in_view = set()
+        self.update_scheduled = False
+        self.verticalScrollBar().valueChanged.connect(self.schedule_update_bars_in_view)
+        self.verticalScrollBar().rangeChanged.connect(self.schedule_update_bars_in_view)
+
         self.adjust_font(1)
         self.adjustFontSignal.connect(self.adjust_font)
 
+    @classmethod
+    def create_window(cls, title):
+        """
+        Create the scrollable window of progress bars, sized as 1/3 of the screen and placed in the bottom right corner.
+        :return: tuple[scroll_area, widget, layout]: the bars are added to the grid layout of the inner widget
+        """
+        layout = QtWidgets.QGridLayout()
+        widget = QtWidgets.QWidget()
+        widget.setLayout(layout)
+
+        # window is a QScrollArea widget
+        scroll_area = cls()
+        scroll_area.setWindowTitle(title)
+        scroll_area.setWidget(widget)
+        scroll_area.setWidgetResizable(True)
+
+        # force it to open as 1/3 width and height the screen, placed in the bottom right corner
+        screen_size = QtWidgets.QDesktopWidget().screenGeometry(-1)
+        screen_w, screen_h = screen_size.width(), screen_size.height()
+        panel_w, panel_h = screen_w // 3, screen_h // 3
+        panel_posx, panel_posy = screen_w - 1.05 * panel_w, (0.95 * screen_h) - 1.1 * panel_h
+        scroll_area.resize(panel_w, panel_h)
+        scroll_area.move(int(panel_posx), int(panel_posy))
+        return scroll_area, widget, layout
+
+    def track_bar(self, pbar):
+        """
+        Format the labels of the bar only while it is in view. Bars are kept in the order they are laid out.
+        """
+        pbar.set_in_view(False)
+        index = len(self.tracked_bars)
+        # usually added below the others, but a bar can take the rows of a removed one
+        while index > 0 and self.tracked_bars[index - 1].layout_row > pbar.layout_row:
+            index -= 1
+        self.tracked_bars.insert(index, pbar)
+        self.schedule_update_bars_in_view()
+
+    def untrack_bar(self, pbar):
+        if pbar in self.bars_in_view:
+            self.bars_in_view.remove(pbar)
+        self.tracked_bars.remove(pbar)
+
+    def clear_tracked_bars(self):
+        self.tracked_bars = []
+        self.bars_in_view = set()
+
+    def schedule_update_bars_in_view(self, *args):
+        # coalesced, so adding many bars or scrolling quickly updates them once
+        if not self.update_scheduled:
+            self.update_scheduled = True
+            QtCore.QTimer.singleShot(0, self.update_bars_in_view)
+
+    def update_bars_in_view(self):
+        """
+        Find the tracked bars within half a page of the viewport by bisection on their position, and format the ones
+        that have come into view.
+        """
+        self.update_scheduled = False
+        if len(self.tracked_bars) == 0 or self.widget() is None:
+            return
+        self.widget().layout().activate()
+        margin = self.viewport().height() // 2
+        top = self.verticalScrollBar().value() - margin
+        bottom = self.verticalScrollBar().value() + self.viewport().height() + margin
+        bars_in_view = set(self.tracked_bars[self.find_bar(top):self.find_bar(bottom) + 1])
+
+        for pbar in self.bars_in_view - bars_in_view:
+            pbar.set_in_view(False)
+        for pbar in bars_in_view - self.bars_in_view:
+            pbar.set_in_view(True)
+        self.bars_in_view = bars_in_view
+
+    def find_bar(self, y):
+        """
+        :return: int: index of the first tracked bar that ends below 'y' (in the coordinates of the scrolled widget)
+        """
+        low, high = 0, len(self.tracked_bars)
+        while low < high:
+            mid = (low + high) // 2
+            pbar = self.tracked_bars[mid]
+            if pbar.y() + pbar.height() < y:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def resizeEvent(self, a0: QtGui.QResizeEvent):
+        super().resizeEvent(a0)
+        self.schedule_update_bars_in_view()
+
     def keyPressEvent(self, a0: QtGui.QKeyEvent):
         if a0.key() == QtCore.Qt.Key.Key_Space:
             self.pauseAllSignal.emit()
@@ -214,6 +425,7 @@ class ZoomingScrollArea(QtWidgets.QScrollArea):
         else:
             self.fontsize = min(100, self.fontsize + incr)
         self.setFont(QtGui.QFont(self.fontname, self.fontsize))
+        self.schedule_update_bars_in_view()
 
 
 class Menu(QtWidgets.QMenu):
@@ -222,12 +434,18 @@ class Menu(QtWidgets.QMenu):
     cancelTaskSignal = QtCore.pyqtSignal(int)
     pauseTaskSignal = QtCore.pyqtSignal(int)
     setNumProcessesSignal = QtCore.pyqtSignal(int)
+    toggleSubBarsSignal = QtCore.pyqtSignal(int)
 
-    def __init__(self, autoscroll, pid, pid_paused):
+    def __init__(self, autoscroll, pid, pid_paused, has_sub_bars=False, cores=None):
+        """
+        :param cores: cores the workers are pinned to, in the order they are used (see affinity.CorePlacement)
+        """
         super(Menu, self).__init__()
         self.autoscroll = autoscroll
         self.pid = pid
         self.pid_paused = pid_paused
+        self.has_sub_bars = has_sub_bars
+        self.cores = cores
 
         self.create_menu()
 
@@ -243,8 +461,9 @@ class Menu(QtWidgets.QMenu):
         # global set num processes menu
         set_num_processes_menu = self.addMenu('Set number of processes')
         self.set_num_process_acts = []
-        for i in range(cpu_count()):
-            process_act = QtWidgets.QAction(f'{i + 1}')
+        for i in range(cpu_count() if self.cores is None else len(self.cores)):
+            label = f'{i + 1}' if self.cores is None else f'{i + 1}  (cores {format_cpulist(self.cores[:i + 1])})'
+            process_act = QtWidgets.QAction(label)
             process_act.triggered.connect(partial(self.send_set_num_processes, i + 1))
             self.set_num_process_acts.append(process_act)
             set_num_processes_menu.addAction(process_act)
@@ -258,6 +477,10 @@ class Menu(QtWidgets.QMenu):
         pause_task_act = self.addAction(pause_str)
         pause_task_act.triggered.connect(self.send_pause_task_signal)
 
+        if self.has_sub_bars:
+            toggle_sub_bars_act = self.addAction(f'Show / hide sub-bars of task {self.pid}')
+            toggle_sub_bars_act.triggered.connect(self.send_toggle_sub_bars_signal)
+
     def send_autoscroll_signal(self):
         self.autoscrollSignal.emit(not self.autoscroll)
 
@@ -267,6 +490,9 @@ class Menu(QtWidgets.QMenu):
     def send_pause_task_signal(self):
         self.pauseTaskSignal.emit(self.pid)
 
+    def send_toggle_sub_bars_signal(self):
+        self.toggleSubBarsSignal.emit(self.pid)
+
     def send_set_num_processes(self, num):
         self.setNumProcessesSignal.emit(num)
 
@@ -0,0 +1,268 @@
+from threading import Thread, Lock
+from multiprocessing.connection import Listener, Client, AuthenticationError
+from PyQt5 import QtCore, QtWidgets
+
+from multiprogressbars.helpers.graphics_widgets import ZoomingScrollArea, LabeledProgressBar, Menu
+from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.protocol import Messages, FrameWriter, read_frame
+
+
+class MonitorCommands:
+    pause_all = 'pause_all'
+    pause_task = 'pause_task'
+    cancel_task = 'cancel_task'
+    set_num_processes = 'set_num_processes'
+
+
+class MonitorServer(QtCore.QThread):
+    """
+    Publishes the progress of a MultibarCore on a local socket, so viewers can attach and detach at any time.
+    A viewer is sent a snapshot of the current state when it attaches, then live updates.
+    Both are sent as frames of records for all tasks over the viewer's connection (see protocol.FrameWriter).
+    Commands from viewers are emitted as the same signals as the Menu, in the GUI thread of the MultibarCore.
+    """
+    pauseAllSignal = QtCore.pyqtSignal()
+    pauseTaskSignal = QtCore.pyqtSignal(int)
+    cancelTaskSignal = QtCore.pyqtSignal(int)
+    setNumProcessesSignal = QtCore.pyqtSignal(int)
+
+    def __init__(self, address, authkey, publish_frequency=0.05):
+        super().__init__()
+        if authkey is None:
+            raise ValueError('An authkey is required for viewers to attach to the monitor')
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.publish_frequency = publish_frequency
+
+        # (pid, bar index): {opcode: latest value}
+        self.snapshot = dict()
+        self.frame = FrameWriter()
+        self.lock = Lock()
+        self.viewers = []
+        self.new_viewers = []
+        self.closed = False
+
+        self.accept_thread = Thread(target=self.accept_viewers, daemon=True)
+        self.accept_thread.start()
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+        self.wait(int(2000 * self.publish_frequency))
+        for conn in self.viewers + self.new_viewers:
+            conn.close()
+
+    def accept_viewers(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            with self.lock:
+                self.new_viewers.append(conn)
+
+    def publish(self, opcode, pid=0, value=0, bar_index=0):
+        """
+        Record an update in the snapshot and add it to the next frame for the attached viewers.
+        Called from the GUI thread.
+        """
+        with self.lock:
+            if opcode == Messages.cleared:
+                self.snapshot = dict()
+            elif opcode == Messages.released:
+                self.snapshot = {key: fields for key, fields in self.snapshot.items() if key[0] != pid}
+            else:
+                self.snapshot.setdefault((pid, bar_index), dict())[opcode] = value
+            if len(self.viewers) > 0 or len(self.new_viewers) > 0:
+                self.frame.add(opcode, value, pid, bar_index)
+
+    def get_snapshot_frame(self):
+        frame = FrameWriter()
+        frame.add(Messages.cleared, 0)
+        for (pid, bar_index), fields in self.snapshot.items():
+            for opcode, value in fields.items():
+                frame.add(opcode, value, pid, bar_index)
+        return frame.take()
+
+    def run(self):
+        while not self.closed:
+            with self.lock:
+                updates = self.frame.take()
+                # new viewers get the snapshot, which already includes these updates
+                viewers = list(self.viewers)
+                new_viewers, self.new_viewers = self.new_viewers, []
+                snapshot = self.get_snapshot_frame() if len(new_viewers) > 0 else None
+                self.viewers.extend(new_viewers)
+
+            for conn in new_viewers:
+                self.send_to_viewer(conn, snapshot)
+            if len(updates) > 0:
+                for conn in viewers:
+                    self.send_to_viewer(conn, updates)
+            self.handle_commands()
+            self.msleep(int(1000 * self.publish_frequency))
+
+    def send_to_viewer(self, conn, frame):
+        try:
+            conn.send_bytes(frame)
+        except (OSError, EOFError):
+            # viewer has detached, the run carries on
+            self.detach_viewer(conn)
+
+    def detach_viewer(self, conn):
+        if conn in self.viewers:
+            self.viewers.remove(conn)
+        conn.close()
+
+    def handle_commands(self):
+        for conn in list(self.viewers):
+            try:
+                while conn.poll():
+                    command, value = conn.recv()
+                    self.send_signal(command, value)
+            except (OSError, EOFError):
+                self.detach_viewer(conn)
+
+    def send_signal(self, command, value):
+        if command == MonitorCommands.pause_all:
+            self.pauseAllSignal.emit()
+        elif command == MonitorCommands.pause_task:
+            self.pauseTaskSignal.emit(value)
+        elif command == MonitorCommands.cancel_task:
+            self.cancelTaskSignal.emit(value)
+        elif command == MonitorCommands.set_num_processes:
+            self.setNumProcessesSignal.emit(value)
+
+
+class MonitorViewer(QtCore.QObject):
+    """
+    Window attached to a (possibly headless) Multibar's monitor, showing its bars and sending it commands.
+    Closing the viewer detaches it without affecting the run.
+    """
+    def __init__(self, address, authkey, poll_frequency=0.02):
+        super().__init__()
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+        self.conn = Client(address, authkey=authkey)
+        self.address = address
+        self.autoscroll = False
+
+        self.pbars = dict()
+        self.scroll_area, self.widget, self.layout = ZoomingScrollArea.create_window(f'Monitor: {address}')
+        self.scroll_area.pauseAllSignal.connect(self.send_pause_all)
+        self.scroll_area.setFocus()
+        self.scroll_area.show()
+
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.receive_updates)
+        self.timer.start(int(1000 * poll_frequency))
+
+    def exec(self):
+        self.app.exec()
+        self.conn.close()
+
+    def receive_updates(self):
+        try:
+            while self.conn.poll():
+                for opcode, pid, bar_index, value in read_frame(self.conn.recv_bytes()):
+                    self.apply_record(opcode, pid, bar_index, value)
+        except (OSError, EOFError):
+            self.timer.stop()
+            self.scroll_area.setWindowTitle(f'Monitor: {self.address} (disconnected)')
+
+    def apply_record(self, opcode, pid, bar_index, value):
+        if opcode == Messages.cleared:
+            self.clear()
+            return
+        if opcode == Messages.released:
+            self.remove_pbar(pid)
+            return
+        if pid not in self.pbars:
+            self.add_pbar(pid)
+        if bar_index > 0:
+            self.update_sub_bar(pid, bar_index, opcode, value)
+        elif opcode == Messages.name:
+            self.pbars[pid].set_name(value)
+        elif opcode == Messages.total:
+            self.pbars[pid].set_total(value)
+        elif opcode == Messages.value:
+            self.pbars[pid].set_value(value)
+            if self.autoscroll:
+                self.scroll_area.ensureWidgetVisible(self.pbars[pid].progress_label, 10, 10)
+        elif opcode == Messages.state:
+            self.set_exit_state(pid, value)
+        elif opcode == Messages.paused:
+            self.pbars[pid].paused = bool(value)
+
+    def update_sub_bar(self, pid, bar_index, opcode, value):
+        sub_bar = self.pbars[pid].get_sub_bar(self.layout, bar_index)
+        if opcode == Messages.value:
+            sub_bar.set_value(value)
+        elif opcode == Messages.name:
+            sub_bar.set_name(value)
+        elif opcode == Messages.total:
+            sub_bar.set_total(value)
+
+    def set_exit_state(self, pid, exit_code):
+        if exit_code == ProcessHandler.CANCELLED:
+            self.pbars[pid].set_state(LabeledProgressBar.StateCancelled)
+        elif exit_code == ProcessHandler.EXCEPTION_RAISED:
+            self.pbars[pid].set_state(LabeledProgressBar.StateException)
+        elif exit_code == ProcessHandler.DEPENDENCY_FAILED:
+            self.pbars[pid].set_state(LabeledProgressBar.StateDependencyFailed)
+        elif exit_code == ProcessHandler.TIMED_OUT:
+            self.pbars[pid].set_state(LabeledProgressBar.StateTimedOut)
+
+    def add_pbar(self, pid):
+        # the name and total of the bar are the next records received for it
+        self.pbars[pid] = LabeledProgressBar(pid=pid, parent=self.widget)
+        self.pbars[pid].add_to_layout(self.layout, pid)
+        self.scroll_area.track_bar(self.pbars[pid])
+        self.pbars[pid].createMenuSignal.connect(self.create_menu)
+
+    def remove_pbar(self, pid):
+        if pid not in self.pbars:
+            return
+        pbar = self.pbars.pop(pid)
+        pbar.remove_from_layout(self.layout)
+        self.scroll_area.untrack_bar(pbar)
+
+    def clear(self):
+        for pbar in self.pbars.values():
+            pbar.remove_from_layout(self.layout)
+        self.scroll_area.clear_tracked_bars()
+        self.pbars = dict()
+
+    def send_command(self, command, value=None):
+        try:
+            self.conn.send((command, value))
+        except (OSError, EOFError):
+            pass  # disconnected, shown by receive_updates
+
+    def send_pause_all(self):
+        self.send_command(MonitorCommands.pause_all)
+
+    def send_pause_task(self, pid):
+        self.send_command(MonitorCommands.pause_task, pid)
+
+    def send_cancel_task(self, pid):
+        if Menu.confirm_remove_task(pid, self.pbars[pid].full_name):
+            self.send_command(MonitorCommands.cancel_task, pid)
+
+    def send_set_num_processes(self, num):
+        self.send_command(MonitorCommands.set_num_processes, num)
+
+    def set_autoscroll_enabled(self, enabled):
+        self.autoscroll = enabled
+
+    def toggle_sub_bars(self, pid):
+        self.pbars[pid].toggle_sub_bars()
+
+    def create_menu(self, pid, mouse_pos, paused):
+        menu = Menu(self.autoscroll, pid, paused, self.pbars[pid].has_sub_bars())
+        menu.toggleSubBarsSignal.connect(self.toggle_sub_bars)
+        menu.autoscrollSignal.connect(self.set_autoscroll_enabled)
+        menu.pauseAllSignal.connect(self.send_pause_all)
+        menu.cancelTaskSignal.connect(self.send_cancel_task)
+        menu.pauseTaskSignal.connect(self.send_pause_task)
+        menu.setNumProcessesSignal.connect(self.send_set_num_processes)
+        menu.exec(mouse_pos)
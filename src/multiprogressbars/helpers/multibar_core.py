@@ -1,14 +1,30 @@
-from copy import copy
+import os
+from collections import deque
+from time import time
+from heapq import heappush, heappop
+from statistics import median
 from PyQt5 import QtCore, QtWidgets
 from multiprocessing import Pool, cpu_count
 
 from multiprogressbars.bar_updater import BarUpdater
+from multiprogressbars.helpers.affinity import CorePlacement
 from multiprogressbars.helpers.graphics_widgets import ZoomingScrollArea, LabeledProgressBar, Menu
 from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.range_task import RangeTask
+from multiprogressbars.helpers.task_store import TaskStore
+from multiprogressbars.helpers.protocol import Messages
+from multiprogressbars.helpers.result_cache import ResultCache
+from multiprogressbars.helpers.remote_pool import RemotePool
+from multiprogressbars.helpers.monitor import MonitorServer
+from multiprogressbars.helpers.recording import EventRecorder
+from multiprogressbars.helpers.worker_context import init_worker
 from multiprogressbars.helpers.util import handle_mutex_and_catch_runtime
 
 
 class MultibarCore(QtCore.QObject):
+    CloseAbort = 'abort'
+    CloseDrain = 'drain'
+
     appStarted = QtCore.pyqtSignal()
     allProcessesFinished = QtCore.pyqtSignal()
     setNameSignal = QtCore.pyqtSignal(int, object)
@@ -16,223 +32,665 @@ class MultibarCore(QtCore.QObject):
     setValueSignal = QtCore.pyqtSignal(int, float)
 
     def __init__(self, title=None, batch_size=None, autoscroll=True, quit_on_finished=True,
-                 max_bar_update_frequency=0.02):
+                 max_bar_update_frequency=0.02, initializer=None, initargs=(), maxtasksperchild=None,
+                 cache_dir=None, cache_max_bytes=None, cache_max_entries=None,
+                 remote_address=None, authkey=None, headless=False, monitor_address=None, monitor_authkey=None,
+                 default_timeout=None, speculative=False, straggler_factor=2.0, straggler_check_frequency=1.0,
+                 record_path=None, affinity=None):
         super(MultibarCore, self).__init__()
-        self.app = QtWidgets.QApplication([])
+        self.headless = headless
+        if headless:
+            # widgets are still used to hold the state of each bar, but are never drawn to a display
+            os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        # a QApplication can only be created once per process, it is shared if one exists (e.g. between sessions)
+        self.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
 
         self.title = title
         self.batch_size = cpu_count() if batch_size is None else batch_size
         self.max_bar_update_frequency = max_bar_update_frequency
+        # set once closing has begun, so that a drain starts no other task
+        self.closing = False
         self.closed = False
 
         self.all_paused = False
         self.autoscroll = autoscroll
         self.quit_on_finished = quit_on_finished
+        self.default_timeout = default_timeout
+        self.speculative = speculative
+        self.straggler_factor = straggler_factor
+        self.straggler_check_frequency = straggler_check_frequency
 
         self.pbars = dict()
         self.tasks = dict()
         self.running_tasks = dict()
         self.on_hold_tasks = dict()
         self.results = dict()
-        self.failed_tasks = dict()
-
-        self.mutex = QtCore.QMutex()
-        self.pool = Pool(self.batch_size)
+        self.store = TaskStore(max_bar_update_frequency)
+        self.retired_tasks = []
+        # ids of released tasks, given to the next tasks added (lowest first)
+        self.free_ids = []
+        # tasks yet to start (in the order they were added), and those of them whose dependencies have all finished
+        self.pending_tasks = dict()
+        self.ready_tasks = deque()
+        self.dependencies = dict()
+        self.dependents = dict()
+        # number of the dependencies of each task that have yet to finish successfully
+        self.unmet_dependencies = dict()
+        # duplicates of straggling tasks, the first of the two to finish provides the result
+        self.speculative_tasks = dict()
+        self.durations = []
+
+        self.cache = None
+        self.cache_keys = dict()
+        if cache_dir is not None:
+            self.cache = ResultCache(cache_dir, max_bytes=cache_max_bytes, max_entries=cache_max_entries)
+
+        # recursive, as a drain delivers the updates of the running tasks to slots that take it too
+        self.mutex = QtCore.QMutex(QtCore.QMutex.Recursive)
+        self.placement = None
+        self.pool = self.create_pool(remote_address, authkey, initializer, initargs, maxtasksperchild, affinity)
+
+        self.monitor = None
+        if monitor_address is not None:
+            self.monitor = MonitorServer(monitor_address, monitor_authkey)
+            print(f'Publishing progress for viewers on {self.monitor.address}')
+
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = EventRecorder(record_path)
 
         self.setup_window(title)
+        self.setup_connections()
 
     def __del__(self):
-        if not self.closed:
+        # nothing to close if the constructor failed before the window was set up (e.g. an invalid affinity)
+        if not self.closed and hasattr(self, 'scroll_area'):
             self.close()
 
-    def close(self):
+    def create_pool(self, remote_address, authkey, initializer, initargs, maxtasksperchild, affinity=None):
+        if remote_address is not None:
+            if affinity is not None:
+                raise ValueError('Workers can only be pinned to cores of a local pool')
+            pool = RemotePool(remote_address, authkey, initializer=initializer, initargs=initargs)
+            print(f'Waiting for worker agents on {pool.address}')
+            return pool
+        if affinity is not None:
+            self.placement = CorePlacement(affinity, self.batch_size)
+        return Pool(self.batch_size, initializer=init_worker, initargs=(initializer, initargs, self.placement),
+                    maxtasksperchild=maxtasksperchild)
+
+    def close(self, mode=CloseAbort, timeout=5.0):
+        """
+        Stop processing, in time proportional to the number of running tasks (tasks yet to start hold no resources).
+        :param mode: 'abort' cancels the running tasks immediately,
+            'drain' lets them finish (keeping their results) and cancels the tasks yet to start
+        :param timeout: bound (s) on the total time spent waiting for tasks, after which a drain is aborted
+        """
+        if mode not in [self.CloseAbort, self.CloseDrain]:
+            raise ValueError(f'Unknown close mode: {mode}')
         self.scroll_area.hide()
-        QtCore.QMutexLocker(self.mutex)
-
-        if len(self.running_tasks) > 0:
-            running_pids = list(self.running_tasks.keys())
-            for pid in running_pids:
-                self.end_task(pid)
-
-        worker_ids = list(self.tasks.keys())
-        for wid in worker_ids:
-            self.tasks[wid].close()
-            self.tasks[wid] = None
+        self.straggler_timer.stop()
+        locker = QtCore.QMutexLocker(self.mutex)
+        deadline = time() + timeout
+        self.closing = True
+
+        for pid in self.pending_tasks:
+            self.set_task_state(pid, ProcessHandler.CANCELLED)
+        self.pending_tasks = dict()
+        self.ready_tasks.clear()
+        if mode == self.CloseDrain:
+            self.drain(deadline)
+
+        # whatever is still running is aborted, and its thread given the rest of the time to stop
+        aborted_tasks = []
+        for pid in list(self.running_tasks) + list(self.on_hold_tasks):
+            task = self.tasks[pid]
+            task.disconnect_signals()
+            task.abort()
+            self.on_hold_tasks.pop(pid, None)
+            self.end_task(pid, ProcessHandler.CANCELLED)
+            aborted_tasks.append(task)
+        # (the aborted tasks still running a worker are also among the retired ones)
+        stopping_tasks = list(dict.fromkeys(aborted_tasks + list(self.speculative_tasks.values()) + self.retired_tasks))
+        for task in stopping_tasks:
+            task.abort()
+        for task in stopping_tasks:
+            task.close(max(int(1000 * (deadline - time())), 0))
+        self.speculative_tasks = dict()
+        self.retired_tasks = []
 
         if self.pool is not None:
             self.pool.close()
             self.pool.terminate()
+        if self.monitor is not None:
+            self.monitor.close()
+        if self.recorder is not None:
+            self.recorder.close()
         self.closed = True
 
     def setup_window(self, title):
-        self.layout = QtWidgets.QGridLayout()
-        self.widget = QtWidgets.QWidget()
-        self.widget.setLayout(self.layout)
-
-        # window is a QScrollArea widget
-        self.scroll_area = ZoomingScrollArea()
-        self.scroll_area.setWindowTitle(title)
-        self.scroll_area.setWidget(self.widget)
-        self.scroll_area.setWidgetResizable(True)
-
-        # force it to open as 1/3 width and height the screen, placed in the bottom right corner
-        screen_size = QtWidgets.QDesktopWidget().screenGeometry(-1)
-        screen_w, screen_h = screen_size.width(), screen_size.height()
-        panel_w, panel_h = screen_w // 3, screen_h // 3
-        panel_posx, panel_posy = screen_w - 1.05 * panel_w, (0.95 * screen_h) - 1.1 * panel_h
-        self.scroll_area.resize(panel_w, panel_h)
-        self.scroll_area.move(panel_posx, panel_posy)
-
+        self.scroll_area, self.widget, self.layout = ZoomingScrollArea.create_window(title)
         self.scroll_area.pauseAllSignal.connect(self.pause_all_tasks)
+        if not self.headless:
+            self.scroll_area.setFocus()
+            self.scroll_area.show()
+
+    def setup_connections(self):
+        self.setValueSignal.connect(self._set_pbar_value)
+        self.setNameSignal.connect(self._set_pbar_name)
+        self.setTotalSignal.connect(self._set_pbar_total)
+
+        self.appStarted.connect(self.start_initial_batch)
+        self.appStarted.connect(self.scroll_down)
+        if self.quit_on_finished:
+            self.allProcessesFinished.connect(self.app.quit)
+
+        self.straggler_timer = QtCore.QTimer()
+        self.straggler_timer.timeout.connect(self.start_speculative_tasks)
+        if self.speculative:
+            self.appStarted.connect(lambda: self.straggler_timer.start(int(1000 * self.straggler_check_frequency)))
+            self.allProcessesFinished.connect(self.straggler_timer.stop)
+
+        if self.monitor is not None:
+            self.monitor.pauseAllSignal.connect(self.pause_all_tasks)
+            self.monitor.pauseTaskSignal.connect(self.pause_task)
+            self.monitor.cancelTaskSignal.connect(self._cancel_task)
+            self.monitor.setNumProcessesSignal.connect(self.set_num_proceses)
+            self.monitor.start()
+
+    def publish(self, opcode, pid=0, value=0, bar_index=0):
+        if self.monitor is not None:
+            self.monitor.publish(opcode, pid, value, bar_index)
+        # values are recorded as they are received, before they are throttled
+        if opcode != Messages.value:
+            self.record(opcode, pid, value, bar_index)
+
+    def record(self, opcode, pid=0, value=0, bar_index=0):
+        if self.recorder is not None:
+            self.recorder.record(opcode, pid, value, bar_index)
+
+    def new_batch(self):
+        """
+        Clear the tasks, bars and results of the previous batch, keeping the pool and window alive.
+        """
+        locker = QtCore.QMutexLocker(self.mutex)
+        # tasks that are still finishing are interrupted, and kept referenced (but silenced) until their thread stops
+        self.retired_tasks = [task for task in self.retired_tasks if not task.isFinished()]
+        for pid, task in self.tasks.items():
+            if task.isRunning():
+                task.requestInterruption()
+                task.disconnect_signals()
+                self.retired_tasks.append(task)
+            else:
+                task.close()
+        for task in self.speculative_tasks.values():
+            task.requestInterruption()
+            task.disconnect_signals()
+            self.retired_tasks.append(task)
+
+        for pbar in self.pbars.values():
+            pbar.remove_from_layout(self.layout)
+        self.scroll_area.clear_tracked_bars()
 
-        self.scroll_area.setFocus()
-        self.scroll_area.show()
+        self.pbars = dict()
+        self.tasks = dict()
+        self.running_tasks = dict()
+        self.on_hold_tasks = dict()
+        self.results = dict()
+        self.store.clear()
+        self.pending_tasks = dict()
+        self.ready_tasks.clear()
+        self.free_ids = []
+        self.dependencies = dict()
+        self.dependents = dict()
+        self.unmet_dependencies = dict()
+        self.speculative_tasks = dict()
+        self.durations = []
+        self.cache_keys = dict()
+        self.all_paused = False
+        self.publish(Messages.cleared)
+
+    def drain(self, deadline):
+        """
+        Let the running tasks finish (without starting any other task), until the deadline
+        """
+        if self.all_paused:
+            self.pause_all_tasks()
+        for pid in list(self.on_hold_tasks):
+            self.running_tasks[pid] = self.on_hold_tasks.pop(pid)
+            self.set_task_state(pid, TaskStore.RUNNING)
+            self.pause_task(pid)
+        while len(self.running_tasks) > 0 and time() < deadline:
+            # results and finished signals are delivered to this thread by the event loop
+            self.app.processEvents()
+            QtCore.QThread.msleep(10)
 
     def set_autoscroll_enabled(self, enabled):
         self.autoscroll = enabled
 
     def scroll_down(self):
         if self.autoscroll:
-            bottom = 0
-            if len(self.results) > 0:
-                bottom = min(max(self.results) + 1, len(self.pbars) - 1)
+            bottom = min(self.store.max_finished + 1, len(self.store) - 1)
+            if bottom not in self.pbars:
+                return  # released
             self.scroll_area.ensureWidgetVisible(self.pbars[bottom].progress_label, 10, 10)
 
-    def add_task(self, func: callable, func_args: tuple = (), func_kwargs: dict = None, desc='', total=1):
+    def add_task(self, func: callable, func_args: tuple = (), func_kwargs: dict = None, desc='', total=1,
+                 depends_on=None, timeout=None, task=None):
         if func_kwargs is None:
             func_kwargs = dict()
         if self.title is None:
             self.title = func.__name__
             self.scroll_area.setWindowTitle(self.title)
 
-        i = len(self.pbars.keys())
+        i = self.next_task_id()
+        depends_on = [] if depends_on is None else list(depends_on)
+        for pid in depends_on:
+            # only earlier tasks can be depended on, so the graph can never contain a cycle
+            if pid not in self.pbars:
+                raise ValueError(f'Task {i} cannot depend on task {pid}, which has not been added')
+
         self.add_task_pbar(i, desc, total)
-        self.add_task_worker(i, func, func_args, func_kwargs)
+        self.publish(Messages.name, i, desc)
+        self.publish(Messages.total, i, total)
+        self.add_dependencies(i, depends_on)
+        if not self.add_cached_result(i, func, func_args, func_kwargs):
+            if task is None:
+                self.add_task_worker(i, func, func_args, func_kwargs, timeout)
+            else:
+                task.pid = i
+                self.tasks[i] = task
+            self.pending_tasks[i] = None
+            if self.unmet_dependencies.get(i, 0) == 0:
+                self.set_ready(i)
         self.add_connections(i)
+        return i
+
+    def add_range_task(self, func: callable, start: int, stop: int, reduce: callable = None, func_args: tuple = (),
+                       func_kwargs: dict = None, desc='', depends_on=None, timeout=None, min_chunk_size=1):
+        task = RangeTask(func, start, stop, reduce, func_args, func_kwargs, pool=self.pool,
+                         timeout=self.default_timeout if timeout is None else timeout, min_chunk_size=min_chunk_size)
+        # the range and the reduce (which decides the shape of the result) are part of the arguments journaled with
+        # the result
+        reduce_identity = ResultCache.get_func_identity(reduce) if reduce is not None else None
+        return self.add_task(func, (range(start, stop), reduce_identity) + tuple(func_args), func_kwargs, desc,
+                             stop - start, depends_on, timeout, task=task)
+
+    def add_dependencies(self, i, depends_on):
+        if len(depends_on) == 0:
+            return
+        self.dependencies[i] = depends_on
+        for pid in depends_on:
+            self.dependents.setdefault(pid, []).append(i)
+        self.unmet_dependencies[i] = sum(1 for pid in depends_on if self.store.state[pid] != ProcessHandler.SUCESSFUL)
+        self.update_waiting_on(i)
+
+    def update_waiting_on(self, pid):
+        waiting_on = [dep for dep in self.dependencies[pid] if dep not in self.results]
+        self.pbars[pid].set_waiting_on(waiting_on)
+
+    def add_cached_result(self, i, func, func_args, func_kwargs):
+        """
+        Look up the task in the result journal; a journaled task is shown as complete and is not run again.
+        :return: bool: True if the result was found
+        """
+        if self.cache is None:
+            return False
+        upstream_keys = [self.cache_keys.get(pid) for pid in self.dependencies.get(i, [])]
+        key = self.cache.get_key(func, func_args, func_kwargs, upstream_keys)
+        self.cache_keys[i] = key
+        found, result = self.cache.get(key)
+        if found:
+            self.results[i] = result
+            self.set_task_state(i, ProcessHandler.SUCESSFUL)
+            self._set_pbar_value(i, self.store.total[i])
+        return found
+
+    def next_task_id(self):
+        return self.free_ids[0] if len(self.free_ids) > 0 else len(self.store)
 
     def add_task_pbar(self, i, pbar_desc, iters_total):
+        if len(self.free_ids) > 0 and self.free_ids[0] == i:
+            heappop(self.free_ids)
+        self.store.add(iters_total, i)
         self.pbars[i] = LabeledProgressBar(
             total=iters_total,
             name=pbar_desc,
             pid=i,
             max_update_freq=self.max_bar_update_frequency,
-            parent=self.widget
+            parent=self.widget,
+            store=self.store
         )
-        self.layout.addWidget(self.pbars[i].prefix_label, i, 0)
-        self.layout.addWidget(self.pbars[i], i, 1)
-        self.layout.addWidget(self.pbars[i].progress_label, i, 2, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
-        self.layout.addWidget(self.pbars[i].frequency_label, i, 3, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
-        self.layout.addWidget(self.pbars[i].elapsed_time_label, i, 4, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
-        self.layout.addWidget(self.pbars[i].remaining_time_label, i, 5, alignment=QtCore.Qt.AlignmentFlag.AlignRight)
-
-    def add_task_worker(self, i, apply_func, func_args, func_kwargs):
-        self.tasks[i] = ProcessHandler(apply_func, func_args, func_kwargs, pid=i, pbar=BarUpdater(), pool=self.pool)
+        self.pbars[i].add_to_layout(self.layout, i)
+        if self.headless:
+            # never drawn, only the numeric state is kept
+            self.pbars[i].set_in_view(False)
+        else:
+            self.scroll_area.track_bar(self.pbars[i])
+
+    def add_task_worker(self, i, apply_func, func_args, func_kwargs, timeout=None):
+        if timeout is None:
+            timeout = self.default_timeout
+        self.tasks[i] = ProcessHandler(apply_func, func_args, func_kwargs, pid=i, pbar=BarUpdater(), pool=self.pool,
+                                       timeout=timeout)
 
     def add_connections(self, i):
-        self.tasks[i].updateNameSignal.connect(self.update_name)
-        self.tasks[i].updateTotalSignal.connect(self.update_total)
-        self.tasks[i].updateValueSignal.connect(self.update_value)
+        if i in self.tasks:
+            self.tasks[i].updateNameSignal.connect(self.update_name)
+            self.tasks[i].updateTotalSignal.connect(self.update_total)
+            self.tasks[i].updateValueSignal.connect(self.update_value)
+            self.tasks[i].updateSubBarSignal.connect(self.update_sub_bar)
+            self.tasks[i].workerReleasedSignal.connect(self.start_ready_tasks)
 
         self.pbars[i].createMenuSignal.connect(self.create_menu)
 
+    def set_task_state(self, pid, state):
+        if self.store.is_finished(pid):
+            return
+        self.store.set_state(pid, state)
+        # every transition is published and recorded, so viewers and replays follow tasks put on hold and resumed
+        self.publish(Messages.state, pid, state)
+
+    def release_task(self, pid):
+        """
+        Forget a finished task whose outcome is kept elsewhere (e.g. an item of a pipeline): remove its bar, and give
+        its id and row of the store to a later task.
+        """
+        task = self.tasks.pop(pid, None)
+        if task is not None:
+            # the late signals of a task still stopping must not reach the task given its id next
+            task.disconnect_signals()
+            if not task.isRunning():
+                task.close()
+            elif task not in self.retired_tasks:
+                self.retired_tasks.append(task)
+        pbar = self.pbars.pop(pid)
+        pbar.remove_from_layout(self.layout)
+        if not self.headless:
+            self.scroll_area.untrack_bar(pbar)
+        self.results.pop(pid, None)
+        heappush(self.free_ids, pid)
+        self.publish(Messages.released, pid)
+
     def set_num_proceses(self, num):
         prev_batch_size = self.batch_size
         self.batch_size = num
         delta = prev_batch_size - self.batch_size
         # more processes requested
         if prev_batch_size < num:
-            for _ in range(abs(delta)):
-                self.start_next()
+            self.start_ready_tasks()
         # fewer processes requested (will pause tasks up to the difference - there must be as many running)
         elif prev_batch_size > num and len(self.running_tasks) > delta:
             running_pids = list(reversed(self.running_tasks.keys()))
+            if self.placement is not None:
+                # release the cores last in the placement's order (e.g. the second socket for 'compact')
+                running_pids.sort(key=lambda pid: self.placement.rank(getattr(self.tasks[pid], 'core', None)),
+                                  reverse=True)
             # get the pid of a running task - put it in the on_hold list, pause it
             for pid in running_pids[:abs(delta)]:
                 self.on_hold_tasks[pid] = self.running_tasks.pop(pid)
+                self.set_task_state(pid, TaskStore.ON_HOLD)
                 self.pause_task(pid)
 
     def begin_processing(self):
-        self.setValueSignal.connect(self._set_pbar_value)
-        self.setNameSignal.connect(self._set_pbar_name)
-        self.setTotalSignal.connect(self._set_pbar_total)
-
-        def start_initial_batch():
-            self.task_queue = iter(self.tasks.values())
-            for _ in range(self.batch_size):
-                self.start_next()
-
+        if len(self.tasks) == 0:
+            return
+        if not self.headless:
+            self.scroll_area.show()
         self.app.processEvents()
 
         QtCore.QTimer.singleShot(0, self.appStarted.emit)
-        self.appStarted.connect(start_initial_batch)
-        self.appStarted.connect(self.scroll_down)
-        if self.quit_on_finished:
-            self.allProcessesFinished.connect(self.app.quit)
-
         self.app.exec()
 
+    def start_initial_batch(self):
+        self.start_ready_tasks()
+        if len(self.running_tasks) == 0:
+            self.allProcessesFinished.emit()
+
+    def start_ready_tasks(self):
+        if self.closed:
+            return
+        # tasks put on hold take the free workers before any new task is started
+        while self.resume_on_hold_task():
+            pass
+        while self.start_next():
+            pass
+        self.split_range_tasks()
+
+    def split_range_tasks(self):
+        """
+        Give the workers left idle once no other task can start part of the remaining items of the running range tasks.
+        """
+        if self.all_paused:
+            return
+        idle_workers = self.batch_size - self.get_busy_workers()
+        range_tasks = [task for pid, task in self.running_tasks.items()
+                       if isinstance(task, RangeTask) and not self.pbars[pid].paused]
+        while idle_workers > 0 and len(range_tasks) > 0:
+            task = max(range_tasks, key=lambda t: t.get_remaining())
+            if task.request_split():
+                idle_workers -= 1
+            else:
+                range_tasks.remove(task)
+
+    def get_busy_workers(self):
+        return (sum(task.num_workers for task in self.running_tasks.values()) + len(self.speculative_tasks)
+                + self.get_stopping_workers())
+
+    def get_stopping_workers(self):
+        """
+        :return: int: workers still running tasks that have ended (e.g. timed out), until they stop or are replaced
+        """
+        self.retired_tasks = [task for task in self.retired_tasks if task.busy_workers > 0 or task.isRunning()]
+        return sum(task.busy_workers for task in self.retired_tasks)
+
     def start_next(self):
-        try:
-            if not self.allowed_to_start_new_task():
-                return
-            next_task = next(self.task_queue)
-            next_task.taskFinishedSignal.connect(self.dequeue_task)
-            next_task.sendResultSignal.connect(self._get_result)
-            next_task.start()
-            self.running_tasks[next_task.pid] = next_task
-        except StopIteration:
-            pass  # end of task_queue has been reached
+        """
+        Start the first pending task whose dependencies have all finished, passing it their results.
+        :return: bool: True if a task was started
+        """
+        if not self.allowed_to_start_new_task():
+            return False
+        pid = self.next_ready_task()
+        if pid is None:
+            return False
+
+        next_task = self.tasks[pid]
+        if pid in self.dependencies:
+            next_task.kwargs['upstream_results'] = {dep: self.results[dep] for dep in self.dependencies[pid]}
+        next_task.taskFinishedSignal.connect(self.dequeue_task)
+        next_task.sendResultSignal.connect(self._get_result)
+        next_task.start()
+        self.running_tasks[pid] = next_task
+        self.set_task_state(pid, TaskStore.RUNNING)
+        return True
+
+    def set_ready(self, pid):
+        """
+        Queue a pending task whose dependencies have all finished, to be started in the order tasks became ready.
+        """
+        self.ready_tasks.append(pid)
+
+    def next_ready_task(self):
+        if self.closing:
+            return None
+        while len(self.ready_tasks) > 0:
+            pid = self.ready_tasks.popleft()
+            # tasks that ended before starting (e.g. cancelled) are left in the queue, and skipped here
+            if pid in self.pending_tasks:
+                del self.pending_tasks[pid]
+                return pid
+        return None
+
+    def has_free_worker(self):
+        return self.get_busy_workers() < self.batch_size and not self.all_paused
 
     def allowed_to_start_new_task(self):
-        if len(self.running_tasks) >= self.batch_size or self.all_paused:
-            return False
-        elif len(self.on_hold_tasks) > 0:
-            pid = list(self.on_hold_tasks.keys())[-1]
-            self.running_tasks[pid] = self.on_hold_tasks.pop(pid)
-            self.pause_task(pid)
+        return self.has_free_worker() and len(self.on_hold_tasks) == 0
+
+    def resume_on_hold_task(self):
+        """
+        Resume a task that was put on hold when the number of processes was lowered, if a worker is free.
+        :return: bool: True if a task was resumed
+        """
+        if len(self.on_hold_tasks) == 0 or not self.has_free_worker():
             return False
+        if self.placement is not None:
+            # reclaim the core first in the placement's order
+            pid = min(self.on_hold_tasks,
+                      key=lambda pid: self.placement.rank(getattr(self.on_hold_tasks[pid], 'core', None)))
+            task = self.on_hold_tasks.pop(pid)
+        else:
+            # the task put on hold last is resumed first
+            pid, task = self.on_hold_tasks.popitem()
+        self.running_tasks[pid] = task
+        self.set_task_state(pid, TaskStore.RUNNING)
+        self.pause_task(pid)
         return True
 
     def end_task(self, pid, exit_code=ProcessHandler.SUCESSFUL):
         if exit_code == ProcessHandler.CANCELLED:
             self.pbars[pid].set_state(LabeledProgressBar.StateCancelled)
-            self.failed_tasks[pid] = ProcessHandler.CANCELLED
         elif exit_code == ProcessHandler.EXCEPTION_RAISED:
             self.pbars[pid].set_state(LabeledProgressBar.StateException)
-            self.failed_tasks[pid] = ProcessHandler.EXCEPTION_RAISED
-
+        elif exit_code == ProcessHandler.DEPENDENCY_FAILED:
+            self.pbars[pid].set_state(LabeledProgressBar.StateDependencyFailed)
+        elif exit_code == ProcessHandler.TIMED_OUT:
+            self.pbars[pid].set_state(LabeledProgressBar.StateTimedOut)
+        self.set_task_state(pid, exit_code)
+
+        self.pending_tasks.pop(pid, None)
+        if pid in self.on_hold_tasks:
+            # (e.g. cancelled while on hold) stopped as a running task, the scheduler no longer waits to resume it
+            self.running_tasks[pid] = self.on_hold_tasks.pop(pid)
         if pid in self.running_tasks:
             self.tasks[pid].requestInterruption()
             self.running_tasks[pid].quit()
             self.running_tasks.pop(pid)
+            if self.tasks[pid].busy_workers > 0:
+                # its worker is only free once it has stopped, which 'workerReleasedSignal' tells
+                self.retired_tasks.append(self.tasks[pid])
+        if pid in self.speculative_tasks:
+            self.retire_speculative_task(pid)
+
+        if exit_code == ProcessHandler.SUCESSFUL:
+            for dependent in self.dependents.get(pid, []):
+                self.update_waiting_on(dependent)
+                self.unmet_dependencies[dependent] -= 1
+                if self.unmet_dependencies[dependent] == 0 and dependent in self.pending_tasks:
+                    self.set_ready(dependent)
+        else:
+            # tasks that depend on a failed or cancelled task can never run
+            for dependent in self.dependents.get(pid, []):
+                if dependent in self.pending_tasks:
+                    self.end_task(dependent, ProcessHandler.DEPENDENCY_FAILED)
 
     def dequeue_task(self, pid, exit_code):
-        self.update_value(pid, self.pbars[pid].total, exit_code)
-        self.end_task(pid, exit_code)
-        self.start_next()
+        if pid in self.results and pid not in self.running_tasks and pid not in self.on_hold_tasks:
+            return  # a speculative duplicate of the task has already finished it
+        if not self.store.is_finished(pid):
+            # a task that was cancelled keeps its state when its worker stops, even with a result
+            if exit_code == ProcessHandler.SUCESSFUL:
+                self.durations.append(self.store.get_duration(pid))
+            self.finish_bar(pid, exit_code)
+            self.end_task(pid, exit_code)
+        self.start_ready_tasks()
         self.scroll_down()
-        if len(self.running_tasks) == 0:
+        if len(self.running_tasks) == 0 and len(self.pending_tasks) == 0 and len(self.on_hold_tasks) == 0:
             self.allProcessesFinished.emit()
 
+    def finish_bar(self, pid, exit_code):
+        self.update_value(pid, self.store.total[pid], exit_code)
+        if exit_code == ProcessHandler.SUCESSFUL and self.pbars[pid].has_sub_bars():
+            for index, sub_bar in self.pbars[pid].sub_bar_panel.pbars.items():
+                sub_bar.set_value(sub_bar.total)
+                self.publish(Messages.value, pid, sub_bar.total, index)
+
+    def start_speculative_tasks(self):
+        """
+        Once no tasks are waiting to start, run a duplicate of each straggler on an idle worker.
+        A straggler is a task expected to take more than 'straggler_factor' times the median duration of finished tasks.
+        """
+        if self.all_paused or len(self.pending_tasks) > 0 or len(self.durations) == 0:
+            return
+        idle_workers = self.batch_size - self.get_busy_workers() - len(self.on_hold_tasks)
+        if idle_workers <= 0:
+            return
+        threshold = self.straggler_factor * median(self.durations)
+        durations = self.store.get_expected_durations(self.running_tasks)
+        # range tasks are split onto idle workers instead
+        stragglers = [(duration, pid) for pid, duration in durations.items()
+                      if duration > threshold and pid not in self.speculative_tasks and not self.pbars[pid].paused
+                      and isinstance(self.tasks[pid], ProcessHandler)]
+        for _, pid in sorted(stragglers, reverse=True)[:idle_workers]:
+            self.start_speculative_task(pid)
+
+    def start_speculative_task(self, pid):
+        task = self.tasks[pid]
+        func_kwargs = {key: value for key, value in task.kwargs.items() if key != 'pbar'}
+        duplicate = ProcessHandler(task.func, task.args, func_kwargs, pid=pid, pbar=BarUpdater(), pool=self.pool,
+                                   timeout=task.timeout)
+        # only the result is used, the bar keeps following the original task
+        duplicate.sendResultSignal.connect(self._get_result)
+        duplicate.taskFinishedSignal.connect(self.speculative_task_finished)
+        duplicate.workerReleasedSignal.connect(self.start_ready_tasks)
+        duplicate.start()
+        self.speculative_tasks[pid] = duplicate
+        print(f'Speculatively re-running straggling task {pid}: {self.pbars[pid].full_name}')
+
+    def speculative_task_finished(self, pid, exit_code):
+        if pid not in self.speculative_tasks:
+            return
+        self.retire_speculative_task(pid)
+        if exit_code == ProcessHandler.SUCESSFUL and pid in self.running_tasks:
+            self.dequeue_task(pid, exit_code)
+        else:
+            # the original task carries on, and can be duplicated again
+            self.start_ready_tasks()
+
+    def retire_speculative_task(self, pid):
+        duplicate = self.speculative_tasks.pop(pid)
+        duplicate.requestInterruption()
+        duplicate.disconnect_signals()
+        self.retired_tasks.append(duplicate)
+
     def pause_all_tasks(self):
         self.all_paused = not self.all_paused
         for i in self.running_tasks:
             self.pbars[i].paused = self.all_paused
             self.tasks[i].set_pause_requested(self.all_paused)
+            self.publish(Messages.paused, i, self.all_paused)
+        for duplicate in self.speculative_tasks.values():
+            duplicate.set_pause_requested(self.all_paused)
+        if not self.all_paused:
+            self.start_ready_tasks()
 
     def cancel_task(self, pid):
+        if pid not in self.tasks:
+            return  # result was taken from the journal
         confirmed = Menu.confirm_remove_task(pid, self.pbars[pid].full_name)
         if confirmed:
-            self.end_task(pid, ProcessHandler.CANCELLED)
-            print(f'Cancelling task {pid}: {self.pbars[pid].full_name}')
+            self._cancel_task(pid)
+
+    def _cancel_task(self, pid):
+        if pid not in self.tasks or self.store.is_finished(pid):
+            return
+        self.end_task(pid, ProcessHandler.CANCELLED)
+        print(f'Cancelling task {pid}: {self.pbars[pid].full_name}')
 
     def pause_task(self, pid):
+        if pid not in self.tasks:
+            return
         self.tasks[pid].set_pause_requested(not self.pbars[pid].paused)
+        if pid in self.speculative_tasks:
+            self.speculative_tasks[pid].set_pause_requested(not self.pbars[pid].paused)
         self.pbars[pid].paused = not self.pbars[pid].paused
+        self.publish(Messages.paused, pid, self.pbars[pid].paused)
 
     def create_menu(self, pid, mouse_pos, paused):
         # create the menu
-        menu = Menu(self.autoscroll, pid, paused)
+        menu = Menu(self.autoscroll, pid, paused, self.pbars[pid].has_sub_bars(),
+                    cores=self.placement.cores if self.placement is not None else None)
 
         # connect the menu signals to their slots
         menu.autoscrollSignal.connect(self.set_autoscroll_enabled, QtCore.Qt.ConnectionType.QueuedConnection)
@@ -240,6 +698,7 @@ class MultibarCore(QtCore.QObject):
         menu.cancelTaskSignal.connect(self.cancel_task)
         menu.pauseTaskSignal.connect(self.pause_task)
         menu.setNumProcessesSignal.connect(self.set_num_proceses)
+        menu.toggleSubBarsSignal.connect(self.toggle_sub_bars)
 
         # execute the menu
         autoscroll_state = self.autoscroll  # reset autoscroll to previous state, disable while menu active
@@ -248,8 +707,13 @@ class MultibarCore(QtCore.QObject):
         self.set_autoscroll_enabled(autoscroll_state)
 
     @handle_mutex_and_catch_runtime
-    def update_value(self, pid, value, exit_code=ProcessHandler.EXCEPTION_RAISED):
-        if self.pbars[pid].allowed_to_set_value(value) or exit_code == ProcessHandler.SUCESSFUL:
+    def update_value(self, pid, value, exit_code=None):
+        """
+        :param exit_code: given once the task has finished (the bar is then always set if it was successful)
+        """
+        if exit_code is None:
+            self.record(Messages.value, pid, value)
+        if self.store.allowed_to_set_value(pid, value) or exit_code == ProcessHandler.SUCESSFUL:
             self.setValueSignal.emit(pid, value)
 
     @handle_mutex_and_catch_runtime
@@ -260,18 +724,50 @@ class MultibarCore(QtCore.QObject):
     def update_total(self, pid, total):
         self.setTotalSignal.emit(pid, total)
 
+    @handle_mutex_and_catch_runtime
+    def update_sub_bar(self, pid, index, field, value):
+        sub_bar = self.pbars[pid].get_sub_bar(self.layout, index)
+        if field == Messages.value:
+            self.record(field, pid, value, index)
+            if not sub_bar.allowed_to_set_value(value):
+                return
+            sub_bar.set_value(value)
+        elif field == Messages.name:
+            sub_bar.set_name(value)
+        elif field == Messages.total:
+            sub_bar.set_total(value)
+        self.publish(field, pid, value, index)
+
+    def toggle_sub_bars(self, pid):
+        self.pbars[pid].toggle_sub_bars()
+
     def _set_pbar_value(self, pbar_id, value):
+        self.store.set_value(pbar_id, value)
         self.pbars[pbar_id].set_value(value)
+        self.publish(Messages.value, pbar_id, value)
 
     def _set_pbar_name(self, pbar_id, name):
         self.pbars[pbar_id].set_name(name)
+        self.publish(Messages.name, pbar_id, name)
 
     def _set_pbar_total(self, pbar_id, total):
+        self.store.set_total(pbar_id, total)
         self.pbars[pbar_id].set_total(total)
+        self.publish(Messages.total, pbar_id, total)
 
     def _get_result(self, pid, result):
+        if pid in self.results:
+            return  # the task and its speculative duplicate both finished, the first result is kept
+        if self.store.is_finished(pid):
+            return  # the task was cancelled (or timed out) before its worker returned
         self.results[pid] = result
+        if pid in self.cache_keys:
+            self.cache.put(self.cache_keys[pid], result)
 
     def get_results(self):
-        return copy([{k: self.results[k] for k in sorted(self.results.keys())},
-                     {k: self.failed_tasks[k] for k in sorted(self.failed_tasks.keys())}])
+        # the store lists the ids of the finished tasks in order
+        finished = self.store.get_pids(ProcessHandler.SUCESSFUL)
+        failed = self.store.get_pids(ProcessHandler.CANCELLED, ProcessHandler.EXCEPTION_RAISED,
+                                     ProcessHandler.DEPENDENCY_FAILED, ProcessHandler.TIMED_OUT)
+        return [{pid: self.results[pid] for pid in finished if pid in self.results},
+                {pid: self.store.state[pid] for pid in failed}]
@@ -0,0 +1,225 @@
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from PyQt5 import QtCore
+
+from multiprogressbars.bar_updater import BarUpdater
+from multiprogressbars.helpers.multibar_core import MultibarCore
+from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.protocol import Messages
+from multiprogressbars.helpers.task_store import TaskStore
+from multiprogressbars.helpers.worker_context import init_worker
+
+
+class Stage:
+    """
+    One stage of a pipeline: its function, its own pool of workers, and the bound on the items waiting for it.
+    """
+    ProcessExecutor = 'process'
+    ThreadExecutor = 'thread'
+
+    def __init__(self, index, func, workers, pool, queue_size, func_args=(), func_kwargs=None, desc='', total=1,
+                 timeout=None):
+        self.index = index
+        self.func = func
+        self.workers = workers
+        self.pool = pool
+        self.queue_size = queue_size
+        self.args = tuple(func_args)
+        self.kwargs = dict(func_kwargs) if func_kwargs is not None else dict()
+        self.desc = desc
+        self.total = total
+        self.timeout = timeout
+        # id of the bar following the items finished by the stage
+        self.pid = None
+        self.finished = 0
+
+
+class PipelineCore(MultibarCore):
+    """
+    Runs items through a chain of stages, each with its own pool of workers (processes or threads).
+    The result of an item in one stage is added as a task of the next stage as soon as it is received, so the stages
+    run concurrently and the throughput is that of the slowest stage.
+    A stage only starts an item while the queue of items waiting for the next stage has room (backpressure), and the
+    input items are only taken from their iterator as the first stage's queue has room.
+    Each stage has a bar counting the items it has finished (its rate is the stage's throughput), above the bars of
+    the items in flight. An item's task is released once it finishes, its bar removed and its id reused, so memory and
+    the window are bounded by the items in flight rather than growing with the items processed.
+    """
+    def __init__(self, title=None, autoscroll=True, quit_on_finished=True, max_bar_update_frequency=0.02,
+                 initializer=None, initargs=(), headless=False, monitor_address=None, monitor_authkey=None,
+                 default_timeout=None, record_path=None):
+        self.stages = []
+        self.initializer = initializer
+        self.initargs = initargs
+        # task id: (stage, item index)
+        self.task_stage = dict()
+        self.items = None
+        self.items_fed = 0
+        self.item_results = dict()
+        self.item_failures = dict()
+        super().__init__(
+            title=title, batch_size=0, autoscroll=autoscroll, quit_on_finished=quit_on_finished,
+            max_bar_update_frequency=max_bar_update_frequency, headless=headless,
+            monitor_address=monitor_address, monitor_authkey=monitor_authkey, default_timeout=default_timeout,
+            record_path=record_path)
+        self.allProcessesFinished.connect(self.finish_stage_bars)
+
+    def create_pool(self, *args):
+        return None  # each stage has its own pool
+
+    def close(self, mode=MultibarCore.CloseAbort, timeout=5.0):
+        super().close(mode, timeout)
+        for stage in self.stages:
+            stage.pool.close()
+            stage.pool.terminate()
+
+    def add_stage(self, func, workers=1, executor=Stage.ProcessExecutor, queue_size=None, func_args=(),
+                  func_kwargs=None, desc='', total=1, timeout=None):
+        if executor == Stage.ProcessExecutor:
+            pool = Pool(workers, initializer=init_worker, initargs=(self.initializer, self.initargs))
+        elif executor == Stage.ThreadExecutor:
+            pool = ThreadPool(workers)
+        else:
+            raise ValueError(f'Unknown executor: {executor}')
+        stage = Stage(len(self.stages), func, workers, pool, 2 * workers if queue_size is None else queue_size,
+                      func_args, func_kwargs, desc or func.__name__, total,
+                      self.default_timeout if timeout is None else timeout)
+        self.stages.append(stage)
+        # the workers of all stages can be busy at once
+        self.batch_size += workers
+        return stage.index
+
+    def run(self, items):
+        """
+        Stream the items through the stages. Blocking until all items are processed (or the window is closed).
+        :param items: iterable of the inputs of the first stage
+        """
+        if len(self.stages) == 0:
+            raise ValueError('The pipeline has no stages')
+        if self.title is None:
+            self.title = ' > '.join(stage.desc for stage in self.stages)
+            self.scroll_area.setWindowTitle(self.title)
+        self.items = iter(items)
+        for stage in self.stages:
+            stage.pid = self.next_task_id()
+            self.add_task_pbar(stage.pid, stage.desc, 0)
+            self.add_connections(stage.pid)
+            self.set_task_state(stage.pid, TaskStore.RUNNING)
+            self.publish(Messages.name, stage.pid, stage.desc)
+        self.feed()
+        if not self.headless:
+            self.scroll_area.show()
+        self.app.processEvents()
+        QtCore.QTimer.singleShot(0, self.appStarted.emit)
+        self.app.exec()
+
+    def feed(self):
+        """
+        Take input items until the first stage's queue is full (or the items are exhausted).
+        """
+        if self.closing:
+            # a drain only finishes the items already started
+            self.items = None
+            return
+        stage = self.stages[0]
+        while self.items is not None and self.get_queued(stage) < stage.queue_size:
+            item = next(self.items, self)
+            if item is self:
+                self.items = None
+                return
+            self.add_stage_task(stage, self.items_fed, item)
+            self.items_fed += 1
+            self._set_pbar_total(stage.pid, self.items_fed)
+
+    def add_stage_task(self, stage, item_index, item):
+        i = self.next_task_id()
+        self.task_stage[i] = (stage, item_index)
+        return self.add_task(stage.func, (item,) + stage.args, stage.kwargs, f'{stage.desc} {item_index}',
+                             stage.total, timeout=stage.timeout)
+
+    def add_task_worker(self, i, apply_func, func_args, func_kwargs, timeout=None):
+        stage, _ = self.task_stage[i]
+        self.tasks[i] = ProcessHandler(apply_func, func_args, func_kwargs, pid=i, pbar=BarUpdater(), pool=stage.pool,
+                                       timeout=timeout)
+
+    def get_queued(self, stage):
+        return sum(1 for pid in self.pending_tasks if self.task_stage[pid][0] is stage)
+
+    def get_running(self, stage):
+        return sum(1 for pid in list(self.running_tasks) + list(self.on_hold_tasks)
+                   if self.task_stage[pid][0] is stage)
+
+    def can_start(self, stage):
+        """
+        A stage can start an item if it has an idle worker, and the item's result will have room in the next
+        stage's queue.
+        """
+        running = self.get_running(stage)
+        if running >= stage.workers:
+            return False
+        if stage.index + 1 == len(self.stages):
+            return True
+        next_stage = self.stages[stage.index + 1]
+        return self.get_queued(next_stage) + running < next_stage.queue_size
+
+    def set_ready(self, pid):
+        pass  # items have no dependencies, they are started by stage (see 'next_ready_task')
+
+    def next_ready_task(self):
+        if self.closing:
+            return None
+        self.feed()
+        startable = dict()
+        for pid in self.pending_tasks:
+            stage = self.task_stage[pid][0]
+            if stage not in startable:
+                startable[stage] = self.can_start(stage)
+            if startable[stage]:
+                del self.pending_tasks[pid]
+                return pid
+        return None
+
+    def _get_result(self, pid, result):
+        stage, item_index = self.task_stage[pid]
+        if stage.index + 1 == len(self.stages):
+            self.item_results[item_index] = result
+        elif self.closing:
+            # drained out of its stage, the item does not enter the next one
+            self.item_failures[item_index] = (stage.index + 1, ProcessHandler.CANCELLED)
+        else:
+            # only the final results are kept, the others stream into the next stage
+            self.add_stage_task(self.stages[stage.index + 1], item_index, result)
+
+    def end_task(self, pid, exit_code=ProcessHandler.SUCESSFUL):
+        super().end_task(pid, exit_code)
+        if pid not in self.task_stage:
+            return  # bar of a stage
+        stage, item_index = self.task_stage[pid]
+        if exit_code == ProcessHandler.SUCESSFUL:
+            stage.finished += 1
+            self.update_value(stage.pid, stage.finished)
+            if stage.index + 1 < len(self.stages) and not self.closing:
+                # the item has entered the next stage
+                next_stage = self.stages[stage.index + 1]
+                self._set_pbar_total(next_stage.pid, self.store.total[next_stage.pid] + 1)
+        else:
+            # the item goes no further
+            self.item_failures[item_index] = (stage.index, exit_code)
+        # its result has been passed on (or kept), and its outcome counted on the stage's bar
+        self.task_stage.pop(pid)
+        self.release_task(pid)
+
+    def finish_stage_bars(self):
+        for stage in self.stages:
+            if self.store.state[stage.pid] == TaskStore.RUNNING:
+                # the bar ends at the items that made it through the stage, not at its total
+                self.update_value(stage.pid, stage.finished, ProcessHandler.SUCESSFUL)
+                self.end_task(stage.pid, ProcessHandler.SUCESSFUL)
+
+    def get_results(self):
+        """
+        :return: list[results: dict[item index, result of the last stage],
+                      failed_items: dict[item index, (stage index, exit code)]]
+        """
+        return [{index: self.item_results[index] for index in sorted(self.item_results)},
+                {index: self.item_failures[index] for index in sorted(self.item_failures)}]
@@ -1,8 +1,15 @@
+import os
+from signal import SIGTERM
 from sys import exc_info, stderr
+from time import time
 from traceback import format_exception
 from multiprocessing import Pipe
+from multiprocessing.pool import Pool, ThreadPool
 from PyQt5 import QtCore
 
+from multiprogressbars.helpers.affinity import get_worker_core
+from multiprogressbars.helpers.protocol import Messages, encode_record, read_frame
+
 
 class ProcessHandler(QtCore.QThread):
     """
@@ -15,88 +22,296 @@ class ProcessHandler(QtCore.QThread):
     updateNameSignal = QtCore.pyqtSignal(int, str)
     updateTotalSignal = QtCore.pyqtSignal(int, float)
     updateValueSignal = QtCore.pyqtSignal(int, float)
+    updateSubBarSignal = QtCore.pyqtSignal(int, int, int, object)
+    splitSignal = QtCore.pyqtSignal(int, int)
+    # the worker is free for another task, emitted when it stops after the task has already finished (e.g. timed out)
+    workerReleasedSignal = QtCore.pyqtSignal()
 
     SUCESSFUL = 0
     CANCELLED = 1
     EXCEPTION_RAISED = 2
+    DEPENDENCY_FAILED = 3
+    TIMED_OUT = 4
+
+    # workers used by the task (see RangeTask, which can use several)
+    num_workers = 1
+    # time (s) a worker is given to stop after an interruption request, before it is killed
+    stop_timeout = 2.0
 
-    def __init__(self, apply_func, func_args=tuple, func_kwargs=None, pid=None, pbar=None, pool=None):
+    def __init__(self, apply_func, func_args=tuple, func_kwargs=None, pid=None, pbar=None, pool=None, timeout=None):
         super().__init__()
         self.func = apply_func
         self.args = func_args
-        self.kwargs = func_kwargs if func_kwargs is not None else dict()
+        self.kwargs = dict(func_kwargs) if func_kwargs is not None else dict()
 
         self.pid = pid
         self.pool = pool
+        self.timeout = timeout
         self.updater = pbar
         self.kwargs['pbar'] = pbar
+        self.updater._task_id = pid if pid is not None else 0
         self.success = False
 
-        self.pipe, self.target_func_pipe = Pipe()
-        self.updater._set_pipe(self.target_func_pipe)
+        # the pipe is only opened while the task runs, so tasks waiting to start hold no file descriptors
+        self.pipe, self.target_func_pipe = None, None
         self.poll_messages_frequency = 0.01
         self.pause_requested = False
         self.paused = False
+        self.split_requested = False
+        # time the task has run for, against its timeout
+        self.clock = RunningClock()
+        # core the worker running the task is pinned to, if the workers are pinned
+        self.core = None
+        # pid of the worker process running the task, and whether it is still running it
+        self.worker_pid = None
+        self.worker_busy = False
+        self.aborted = False
         self.closed = False
 
     def __del__(self):
         if not self.closed:
-            self.close()
+            try:
+                self.close()
+            except RuntimeError:
+                # the thread object has already been deleted by Qt (e.g. at interpreter exit)
+                self.close_pipes()
 
-    def close(self):
-        self.target_func_pipe.close()
-        self.pipe.close()
-        self.wait(100)
-        self.quit()
+    def close(self, timeout=100):
+        """
+        :param timeout: int: time (ms) to wait for the thread to stop
+        """
         self.closed = True
+        self.abort()
+        self.wait(timeout)
+        self.close_pipes()
+        self.quit()
+
+    def abort(self):
+        """
+        Stop following the task straight away, without waiting for the worker to acknowledge the interruption
+        (e.g. as the pool is about to be terminated). The task finishes as cancelled.
+        """
+        self.aborted = True
+        self.requestInterruption()
+
+    def open_pipes(self):
+        self.pipe, self.target_func_pipe = Pipe()
+        self.updater._set_pipe(self.target_func_pipe)
+
+    def close_pipes(self):
+        for pipe in [self.pipe, self.target_func_pipe]:
+            if pipe is not None:
+                pipe.close()
+
+    def disconnect_signals(self):
+        for signal in [self.taskFinishedSignal, self.sendResultSignal, self.updateNameSignal,
+                       self.updateTotalSignal, self.updateValueSignal, self.updateSubBarSignal, self.splitSignal]:
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass  # nothing was connected
+
+    @property
+    def busy_workers(self):
+        """
+        :return: int: the workers still running the task, which can't be given another task yet
+        """
+        return 1 if self.worker_busy else 0
 
     def set_pause_requested(self, new_paused_state):
         self.pause_requested = True
         self.paused = new_paused_state
+        self.clock.set_paused(new_paused_state)
+
+    def request_split(self):
+        """
+        Ask the worker to hand off the second half of its remaining items, answered with 'splitSignal'.
+        Only used for the chunks of a RangeTask.
+        """
+        self.split_requested = True
 
     def run(self):
         try:
-            p = self.pool.apply_async(self.func, args=self.args, kwds=self.kwargs)
+            self.open_pipes()
+            p = self.pool.apply_async(run_task, args=(self.func,) + tuple(self.args), kwds=self.kwargs)
+            self.worker_busy = True
             self.handle_messages(p)
+            self.worker_busy = False
             out = p.get()
             self.sendResultSignal.emit(self.pid, out)
             self.taskFinishedSignal.emit(self.pid, self.SUCESSFUL)
         except InterruptTask:
             self.taskFinishedSignal.emit(self.pid, self.CANCELLED)
+        except TaskTimeout:
+            self.taskFinishedSignal.emit(self.pid, self.TIMED_OUT)
+            print(f'Task {self.pid} timed out after {self.timeout} s', file=stderr)
+            self.wait_for_worker(p)
         except:
+            self.worker_busy = False
+            if self.closed:
+                # the pipes were closed while the task was still running (e.g. the Multibar was closed)
+                self.taskFinishedSignal.emit(self.pid, self.CANCELLED)
+                return
             self.taskFinishedSignal.emit(self.pid, self.EXCEPTION_RAISED)
             ex = exc_info()
             print(f'----- EXCEPTION RAISED BY TASK: {self.pid} -----', file=stderr)
             [print(arg.replace('\n\n', '\n'), file=stderr) for arg in format_exception(*ex)]
             print(f'----- End traceback for task: {self.pid} -----\n', file=stderr)
+        finally:
+            self.close_pipes()
+            if self.worker_busy:
+                self.worker_busy = False
+                self.workerReleasedSignal.emit()
 
     def handle_messages(self, p):
+        self.clock.start()
+        interruption_time = None
         while not p.ready():
+            if self.aborted:
+                raise InterruptTask
+            # a paused task (e.g. put on hold when the number of processes was lowered) is not timed
+            if self.timeout is not None and self.clock.elapsed() > self.timeout:
+                # the worker stops at its next progress update, the result is abandoned either way
+                self.pipe.send_bytes(encode_record(Messages.interruption_request, True))
+                raise TaskTimeout
             if self.pipe.poll(self.poll_messages_frequency):
-                message = self.pipe.recv()
-                self.send_signal(message)
-            if self.isInterruptionRequested():
-                self.pipe.send((Messages.interruption_request, True))
+                self.send_signal(self.pipe.recv_bytes())
+            if self.isInterruptionRequested() and interruption_time is None:
+                self.pipe.send_bytes(encode_record(Messages.interruption_request, True))
+                interruption_time = time()
+            elif interruption_time is not None and time() - interruption_time > self.stop_timeout:
+                # the task has not reported any progress since (e.g. it is stuck), so it never saw the request
+                interruption_time = float('inf')
+                if self.kill_worker():
+                    raise InterruptTask
             if self.pause_requested:
-                self.pipe.send((Messages.pause_request, self.paused))
+                self.pipe.send_bytes(encode_record(Messages.pause_request, self.paused))
                 self.pause_requested = False
+            if self.split_requested:
+                self.pipe.send_bytes(encode_record(Messages.split_request, True))
+                self.split_requested = False
+        # records sent just before the task returned, which must not be lost (e.g. the hand-off of a split)
+        while self.pipe.poll():
+            self.send_signal(self.pipe.recv_bytes())
+
+    def wait_for_worker(self, p):
+        """
+        Wait for the worker of an abandoned task to stop, so that it is not counted as free while it still runs the
+        task. A worker that has not stopped after 'stop_timeout' seconds is killed, and replaced by the pool.
+        Workers that can't be killed (threads, remote agents) are waited for until the task returns.
+        """
+        deadline = time() + self.stop_timeout
+        try:
+            while not p.ready() and not self.aborted:
+                if time() > deadline and self.kill_worker():
+                    return
+                if self.pipe.poll(self.poll_messages_frequency):
+                    # the progress of the abandoned task is dropped, but read so the worker does not block on the pipe
+                    self.pipe.recv_bytes()
+        except OSError:
+            pass  # the pipes have been closed
+
+    def kill_worker(self):
+        """
+        Kill the worker process running the task. Only the workers of a local process pool are killed, as the pool
+        replaces them with new ones.
+        :return: bool: True if the worker was killed
+        """
+        if self.worker_pid is None or not isinstance(self.pool, Pool) or isinstance(self.pool, ThreadPool):
+            return False
+        # the worker may have exited meanwhile, and its pid been reused
+        if self.worker_pid not in [worker.pid for worker in self.pool._pool]:
+            return False
+        try:
+            os.kill(self.worker_pid, SIGTERM)
+        except ProcessLookupError:
+            return False
+        print(f'Killed the worker of task {self.pid}, which did not stop when interrupted', file=stderr)
+        self.worker_pid = None
+        return True
+
+    def send_signal(self, frame):
+        for field, _, bar_index, value in read_frame(frame):
+            if bar_index > 0:
+                self.updateSubBarSignal.emit(self.pid, bar_index, field, value)
+            elif field == Messages.value:
+                self.updateValueSignal.emit(self.pid, value)
+            elif field == Messages.name:
+                self.updateNameSignal.emit(self.pid, value)
+            elif field == Messages.total:
+                self.updateTotalSignal.emit(self.pid, value)
+            elif field == Messages.split:
+                self.splitSignal.emit(self.pid, int(value))
+            elif field == Messages.core:
+                self.core = int(value)
+            elif field == Messages.worker:
+                self.worker_pid = int(value)
+
+
+def run_task(func, /, *args, **kwargs):
+    """
+    Runs the task function in the worker, then sends any progress updates still held back by its BarUpdater
+    (and stops the thread of its SharedCounters).
+    """
+    pbar = kwargs.get('pbar')
+    if pbar is not None:
+        # sent straight away, so that the worker can be killed if the task gets stuck before reporting progress
+        pbar._add_record(Messages.worker, os.getpid())
+        core = get_worker_core()
+        if core is not None:
+            pbar._add_record(Messages.core, core)
+        pbar._root._flush()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        if kwargs.get('pbar') is not None:
+            try:
+                kwargs['pbar']._finish()
+            except OSError:
+                pass  # the ProcessHandler has been closed
+
+
+class RunningClock:
+    """
+    Time a task has been running for, leaving out the time it was paused.
+    Paused and resumed from the GUI thread, read from the task's thread.
+    """
+    def __init__(self):
+        self.start_time = None
+        self.paused_since = None
+        self.paused_time = 0
+
+    def start(self):
+        self.start_time = time()
+        if self.paused_since is not None:
+            # paused before it started
+            self.paused_since = self.start_time
+
+    def set_paused(self, paused):
+        now = time()
+        if paused and self.paused_since is None:
+            self.paused_since = now
+        elif not paused and self.paused_since is not None:
+            self.paused_time += now - self.paused_since
+            self.paused_since = None
+
+    def elapsed(self):
+        """
+        :return: float: time (s) since the start, without the time paused (0 if not started)
+        """
+        if self.start_time is None:
+            return 0
+        now = time()
+        # read before the total, so that a resume in between counts the interval twice rather than not at all
+        paused_since = self.paused_since
+        paused_time = self.paused_time
+        if paused_since is not None:
+            paused_time += now - paused_since
+        return now - self.start_time - paused_time
+
 
-    def send_signal(self, message):
-        field, value = message
-        if field == Messages.value:
-            self.updateValueSignal.emit(self.pid, value)
-        elif field == Messages.name:
-            self.updateNameSignal.emit(self.pid, value)
-        elif field == Messages.total:
-            self.updateTotalSignal.emit(self.pid, value)
-
-
-class Messages:
-    name = 'name'
-    total = 'total'
-    value = 'value'
-    interruption_request = 'interruption_request'
-    pause_request = 'pause_request'
+class TaskTimeout(TimeoutError):
+    """ The task ran for longer than its wall-clock timeout """
 
 
 class InterruptTask(InterruptedError):
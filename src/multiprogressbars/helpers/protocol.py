@@ -0,0 +1,88 @@
+from struct import Struct
+
+
+class Messages:
+    """
+    Opcodes of the records in a progress frame.
+    """
+    name = 1
+    total = 2
+    value = 3
+    interruption_request = 4
+    pause_request = 5
+    # range tasks: the scheduler asks a chunk to split, the worker replies with the start of the handed off items
+    split_request = 9
+    split = 10
+    # core the task's worker is pinned to, sent when the task starts
+    core = 11
+    # pid of the worker process running the task, sent when the task starts
+    worker = 12
+    # the task has been forgotten (its bars removed), its id may be given to a later task
+    released = 13
+    # monitor only
+    state = 6
+    paused = 7
+    cleared = 8
+
+    text_opcodes = frozenset([name])
+
+
+# every record starts with: opcode, task id, bar index (0 for the task's own bar, then its sub-bars)
+RECORD_HEADER = Struct('<BIH')
+# numeric records are followed by a double, text records by the length of the utf-8 encoded string
+NUMBER_RECORD = Struct('<BIHd')
+TEXT_RECORD = Struct('<BIHH')
+MAX_TEXT_LENGTH = 2 ** 16 - 1
+
+
+class FrameWriter:
+    """
+    Packs records for any number of tasks and bars into a single frame, to be sent with 'Connection.send_bytes'.
+    Numbers are packed as doubles and text as length prefixed utf-8, so neither end needs to pickle anything.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def add(self, opcode, value, task_id=0, bar_index=0):
+        if opcode in Messages.text_opcodes:
+            data = str(value).encode()[:MAX_TEXT_LENGTH]
+            self.buffer += TEXT_RECORD.pack(opcode, task_id, bar_index, len(data))
+            self.buffer += data
+        else:
+            self.buffer += NUMBER_RECORD.pack(opcode, task_id, bar_index, value)
+
+    def take(self):
+        """
+        :return: bytes: the frame of all records added since the last call
+        """
+        frame = bytes(self.buffer)
+        self.buffer.clear()
+        return frame
+
+
+def encode_record(opcode, value, task_id=0, bar_index=0):
+    frame = FrameWriter()
+    frame.add(opcode, value, task_id, bar_index)
+    return frame.take()
+
+
+def read_frame(frame):
+    """
+    Decode the records in a frame.
+    :return: generator of tuple[opcode, task_id, bar_index, value]
+    """
+    offset = 0
+    while offset < len(frame):
+        opcode, task_id, bar_index = RECORD_HEADER.unpack_from(frame, offset)
+        if opcode in Messages.text_opcodes:
+            length = TEXT_RECORD.unpack_from(frame, offset)[3]
+            start = offset + TEXT_RECORD.size
+            offset = start + length
+            value = frame[start:offset].decode(errors='replace')
+        else:
+            value = NUMBER_RECORD.unpack_from(frame, offset)[3]
+            offset += NUMBER_RECORD.size
+        yield opcode, task_id, bar_index, value
@@ -0,0 +1,232 @@
+from sys import exc_info, stderr
+from time import time
+from functools import reduce as reduce_partials
+from traceback import format_exception
+from PyQt5 import QtCore
+
+from multiprogressbars.bar_updater import BarUpdater
+from multiprogressbars.helpers.process_handler import ProcessHandler, RunningClock
+
+
+class RangeTask(QtCore.QObject):
+    """
+    Task over the items [start, stop), run as chunks that are each handled by a ProcessHandler.
+    It starts as one chunk, and the scheduler asks it to split the remainder of a running chunk whenever a worker is
+    idle. The progress of the chunks is merged into the task's bar, and their results are combined with 'reduce'.
+    To the MultibarCore it behaves as a single ProcessHandler that can use several workers.
+    """
+    taskFinishedSignal = QtCore.pyqtSignal(object, int)
+    sendResultSignal = QtCore.pyqtSignal(object, object)
+    updateNameSignal = QtCore.pyqtSignal(int, str)
+    updateTotalSignal = QtCore.pyqtSignal(int, float)
+    updateValueSignal = QtCore.pyqtSignal(int, float)
+    updateSubBarSignal = QtCore.pyqtSignal(int, int, int, object)
+    workerReleasedSignal = QtCore.pyqtSignal()
+
+    def __init__(self, apply_func, start, stop, reduce=None, func_args=(), func_kwargs=None, pid=None, pool=None,
+                 timeout=None, min_chunk_size=1):
+        super().__init__()
+        self.func = apply_func
+        self.args = func_args
+        self.kwargs = dict(func_kwargs) if func_kwargs is not None else dict()
+        self.start_item = start
+        self.stop_item = stop
+        self.reduce = reduce
+        self.min_chunk_size = min_chunk_size
+
+        self.pid = pid
+        self.pool = pool
+        self.timeout = timeout
+        # time the task has run for (without the time paused), against its timeout
+        self.clock = RunningClock()
+
+        # chunk index: ProcessHandler, of the running chunks
+        self.chunks = dict()
+        self.finished_chunks = []
+        # chunk index: [start, stop] (the stop moves back when the chunk is split)
+        self.bounds = dict()
+        self.progress = dict()
+        # start of chunk: result
+        self.partials = dict()
+        self.split_requests = set()
+        self.unsplittable = set()
+
+        self.paused = False
+        self.interrupted = False
+        self.finished = False
+        self.closed = False
+
+    @property
+    def num_workers(self):
+        # a requested split is counted, as it is answered by starting a new chunk
+        return len(self.chunks) + len(self.split_requests)
+
+    @property
+    def busy_workers(self):
+        # workers still running chunks, including those of chunks that have already finished (e.g. timed out)
+        return sum(chunk.busy_workers for chunk in list(self.chunks.values()) + self.finished_chunks)
+
+    def start(self):
+        self.clock.start()
+        self.start_chunk(self.start_item, self.stop_item)
+
+    def start_chunk(self, start, stop):
+        index = len(self.bounds)
+        self.bounds[index] = [start, stop]
+        pbar = BarUpdater()
+        pbar._range = [start, stop]
+        pbar._min_split_size = self.min_chunk_size
+
+        chunk = ProcessHandler(run_chunk, (self.func,) + tuple(self.args), self.kwargs, pid=self.pid, pbar=pbar,
+                               pool=self.pool, timeout=self.get_remaining_timeout())
+        chunk.chunk_index = index
+        chunk.updateValueSignal.connect(self.update_chunk_value)
+        chunk.updateNameSignal.connect(self.updateNameSignal)
+        chunk.updateSubBarSignal.connect(self.updateSubBarSignal)
+        chunk.splitSignal.connect(self.chunk_split)
+        chunk.sendResultSignal.connect(self.get_chunk_result)
+        chunk.taskFinishedSignal.connect(self.chunk_finished)
+        chunk.workerReleasedSignal.connect(self.workerReleasedSignal)
+        if self.paused:
+            chunk.set_pause_requested(True)
+        self.chunks[index] = chunk
+        chunk.start()
+
+    def get_remaining_timeout(self):
+        if self.timeout is None:
+            return None
+        return max(self.timeout - self.clock.elapsed(), 0)
+
+    def get_remaining(self, index=None):
+        """
+        :param index: chunk index, or None for all running chunks
+        :return: int: number of items not yet reported as done
+        """
+        if index is None:
+            return sum(self.get_remaining(i) for i in self.chunks)
+        start, stop = self.bounds[index]
+        return stop - start - self.progress.get(index, 0)
+
+    def request_split(self):
+        """
+        Ask the running chunk with the most items left to hand the second half of them to a new chunk.
+        :return: bool: True if a chunk was asked to split
+        """
+        if self.finished or self.interrupted or self.paused:
+            return False
+        candidates = [(self.get_remaining(i), i) for i in self.chunks
+                      if i not in self.split_requests and i not in self.unsplittable]
+        candidates = [(remaining, i) for remaining, i in candidates if remaining >= 2 * self.min_chunk_size]
+        if len(candidates) == 0:
+            return False
+        _, index = max(candidates)
+        self.split_requests.add(index)
+        self.chunks[index].request_split()
+        return True
+
+    def update_chunk_value(self, pid, value):
+        self.progress[self.sender().chunk_index] = value
+        self.updateValueSignal.emit(self.pid, sum(self.progress.values()))
+
+    def chunk_split(self, pid, split):
+        index = self.sender().chunk_index
+        self.split_requests.discard(index)
+        if split < 0:
+            # too few items left, the worker that was meant for the new chunk is free again
+            self.unsplittable.add(index)
+            self.workerReleasedSignal.emit()
+            return
+        stop = self.bounds[index][1]
+        self.bounds[index][1] = split
+        if not self.interrupted and not self.finished:
+            self.start_chunk(split, stop)
+
+    def get_chunk_result(self, pid, result):
+        self.partials[self.bounds[self.sender().chunk_index][0]] = result
+
+    def chunk_finished(self, pid, exit_code):
+        chunk = self.sender()
+        self.chunks.pop(chunk.chunk_index, None)
+        self.split_requests.discard(chunk.chunk_index)
+        self.finished_chunks.append(chunk)
+        if self.finished:
+            return
+        if exit_code != ProcessHandler.SUCESSFUL:
+            # the task fails with its first chunk that fails (or is cancelled, or times out)
+            self.finish(exit_code)
+        elif len(self.chunks) == 0:
+            self.finish_successfully()
+        else:
+            self.workerReleasedSignal.emit()
+
+    def finish_successfully(self):
+        partials = [self.partials[start] for start in sorted(self.partials)]
+        try:
+            result = partials if self.reduce is None else reduce_partials(self.reduce, partials)
+        except:
+            ex = exc_info()
+            print(f'----- EXCEPTION RAISED BY REDUCE OF TASK: {self.pid} -----', file=stderr)
+            [print(arg.replace('\n\n', '\n'), file=stderr) for arg in format_exception(*ex)]
+            print(f'----- End traceback for task: {self.pid} -----\n', file=stderr)
+            self.finish(ProcessHandler.EXCEPTION_RAISED)
+            return
+        self.sendResultSignal.emit(self.pid, result)
+        self.finish(ProcessHandler.SUCESSFUL)
+
+    def finish(self, exit_code):
+        self.finished = True
+        for chunk in self.chunks.values():
+            chunk.requestInterruption()
+        self.taskFinishedSignal.emit(self.pid, exit_code)
+
+    def requestInterruption(self):
+        self.interrupted = True
+        for chunk in self.chunks.values():
+            chunk.requestInterruption()
+
+    def abort(self):
+        self.interrupted = True
+        for chunk in self.chunks.values():
+            chunk.abort()
+
+    def set_pause_requested(self, new_paused_state):
+        self.paused = new_paused_state
+        self.clock.set_paused(new_paused_state)
+        for chunk in self.chunks.values():
+            chunk.set_pause_requested(new_paused_state)
+
+    def isRunning(self):
+        return any(chunk.isRunning() for chunk in list(self.chunks.values()) + self.finished_chunks)
+
+    def isFinished(self):
+        return not self.isRunning()
+
+    def quit(self):
+        pass  # the chunks stop once interrupted
+
+    def close(self, timeout=100):
+        """
+        :param timeout: int: total time (ms) to wait for the chunks to stop
+        """
+        self.abort()
+        deadline = time() + timeout / 1000
+        for chunk in list(self.chunks.values()) + self.finished_chunks:
+            chunk.close(max(int(1000 * (deadline - time())), 0))
+        self.closed = True
+
+    def disconnect_signals(self):
+        for signal in [self.taskFinishedSignal, self.sendResultSignal, self.updateNameSignal, self.updateTotalSignal,
+                       self.updateValueSignal, self.updateSubBarSignal, self.workerReleasedSignal]:
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass  # nothing was connected
+
+
+def run_chunk(func, /, *args, pbar=None, **kwargs):
+    """
+    Runs the chunk function of a range task in the worker, passing it the items of its chunk as the first argument.
+    """
+    # the items are counted as the bar's value, the absolute items yielded by 'pbar(items)' would add to the count
+    pbar._manually_updating_value = True
+    return func(pbar._iter_range(), *args, pbar=pbar, **kwargs)
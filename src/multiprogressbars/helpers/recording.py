@@ -0,0 +1,62 @@
+from time import perf_counter
+from struct import Struct
+
+from multiprogressbars.helpers.protocol import FrameWriter
+
+MAGIC = b'MPBREC1\n'
+# each entry: time (s) since the recording started, length of the frame that follows
+ENTRY_HEADER = Struct('<dI')
+
+
+class EventRecorder:
+    """
+    Append-only recording of the progress events of a Multibar, for replaying them later (see multiprogressbars.replay).
+    Events are stored as protocol records (see protocol.FrameWriter). The records received within 'resolution'
+    seconds of each other are written as one frame, stamped with the time since the recording started.
+    """
+    def __init__(self, path, resolution=0.01):
+        self.path = path
+        self.resolution = resolution
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.start_time = perf_counter()
+        self.frame = FrameWriter()
+        self.frame_time = 0
+
+    def record(self, opcode, pid=0, value=0, bar_index=0):
+        now = perf_counter() - self.start_time
+        if len(self.frame) > 0 and now - self.frame_time >= self.resolution:
+            self.write_frame()
+        if len(self.frame) == 0:
+            self.frame_time = now
+        self.frame.add(opcode, value, pid, bar_index)
+
+    def write_frame(self):
+        frame = self.frame.take()
+        self.file.write(ENTRY_HEADER.pack(self.frame_time, len(frame)))
+        self.file.write(frame)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if len(self.frame) > 0:
+            self.write_frame()
+        self.file.close()
+
+
+def read_recording(path):
+    """
+    :return: generator of tuple[time: float, frame: bytes], in the order they were recorded
+    """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path} is not a progress recording')
+        while True:
+            header = f.read(ENTRY_HEADER.size)
+            if len(header) < ENTRY_HEADER.size:
+                return  # end of the recording (or a truncated last entry, if the run was killed)
+            timestamp, length = ENTRY_HEADER.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                return
+            yield timestamp, frame
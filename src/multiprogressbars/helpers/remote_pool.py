@@ -0,0 +1,212 @@
+import pickle
+from sys import exc_info
+from collections import deque
+from threading import Thread, Condition, Event
+from traceback import format_exception
+from multiprocessing.connection import Listener, Client, AuthenticationError
+
+from multiprogressbars.helpers.process_handler import InterruptTask
+from multiprogressbars.helpers.worker_context import init_worker, get_worker_context
+
+
+class RemoteTraceback(Exception):
+    """ Traceback of an exception raised by a task on a remote agent """
+    def __str__(self):
+        return self.args[0]
+
+
+class RemoteResult:
+    """
+    Stands in for multiprocessing.pool.AsyncResult, for a task that is run by a remote agent.
+    """
+    def __init__(self, func, args, kwds):
+        self.func = func
+        self.args = args
+        self.kwds = dict(kwds)
+        # the local pipe end that the BarUpdater would have used, its messages are relayed to/from the agent
+        self.pipe = None
+        if 'pbar' in self.kwds:
+            self.pipe = self.kwds['pbar']._pipe
+            self.kwds['pbar'] = self.kwds['pbar']._detach()
+
+        self._event = Event()
+        self._success = False
+        self._value = None
+
+    def ready(self):
+        return self._event.is_set()
+
+    def get(self, timeout=None):
+        self._event.wait(timeout)
+        if not self.ready():
+            raise TimeoutError
+        if self._success:
+            return self._value
+        raise self._value
+
+    def _set(self, success, value):
+        self._success = success
+        self._value = value
+        self._event.set()
+
+
+class RemotePool:
+    """
+    Replacement for multiprocessing.Pool which runs tasks on worker agents that connect over TCP.
+    Agents (see multiprogressbars.agent) can run on any host that can import the task functions.
+    Each agent pulls one task at a time, and relays its BarUpdater messages over its connection.
+    """
+    def __init__(self, address, authkey, initializer=None, initargs=()):
+        if authkey is None:
+            raise ValueError('An authkey is required to accept remote worker agents')
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.initializer = initializer
+        self.initargs = initargs
+
+        self.jobs = deque()
+        self.connections = []
+        self.condition = Condition()
+        self.closed = False
+
+        self.accept_thread = Thread(target=self.accept_agents, daemon=True)
+        self.accept_thread.start()
+
+    def apply_async(self, func, args=(), kwds=None):
+        result = RemoteResult(func, args, kwds if kwds is not None else dict())
+        with self.condition:
+            self.jobs.append(result)
+            self.condition.notify()
+        return result
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.listener.close()
+
+    def terminate(self):
+        self.close()
+        for conn in self.connections:
+            conn.close()
+        while len(self.jobs) > 0:
+            self.jobs.popleft()._set(False, InterruptTask())
+
+    def accept_agents(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+                conn.send(('init', self.initializer, self.initargs))
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            self.connections.append(conn)
+            Thread(target=self.serve_agent, args=(conn,), daemon=True).start()
+
+    def next_job(self):
+        with self.condition:
+            while len(self.jobs) == 0 and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            return self.jobs.popleft()
+
+    def serve_agent(self, conn):
+        while True:
+            job = self.next_job()
+            if job is None:
+                return
+            try:
+                conn.send(('task', job.func, job.args, job.kwds))
+            except (OSError, EOFError):
+                # the agent has gone away before starting the task, give it to another agent
+                with self.condition:
+                    self.jobs.appendleft(job)
+                    self.condition.notify()
+                return
+            try:
+                self.relay_messages(conn, job)
+            except (OSError, EOFError):
+                job._set(False, ConnectionError('Worker agent disconnected while running the task'))
+                return
+
+    @staticmethod
+    def relay_messages(conn, job):
+        while True:
+            if conn.poll(0.01):
+                kind, message = conn.recv()
+                if kind == 'result':
+                    success, value = message
+                    if not success:
+                        value, tb = value
+                        value.__cause__ = RemoteTraceback(tb)
+                    job._set(success, value)
+                    return
+                elif kind == 'progress' and job.pipe is not None:
+                    RemotePool.relay_local(job, job.pipe.send_bytes, message)
+            while job.pipe is not None and RemotePool.relay_local(job, job.pipe.poll):
+                conn.send(('control', job.pipe.recv_bytes()))
+
+    @staticmethod
+    def relay_local(job, pipe_method, *args):
+        try:
+            return pipe_method(*args)
+        except OSError:
+            # the ProcessHandler has been closed, keep running the task until the agent is free
+            job.pipe = None
+            return False
+
+
+class AgentPipe:
+    """
+    Stands in for the BarUpdater's pipe end on an agent, relaying its messages over the scheduler connection.
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def send_bytes(self, frame):
+        self.conn.send(('progress', frame))
+
+    def poll(self, timeout=0.0):
+        return self.conn.poll(timeout)
+
+    def recv_bytes(self):
+        # only control messages are sent to the agent while it is running a task
+        kind, message = self.conn.recv()
+        return message
+
+
+def run_agent(address, authkey):
+    """
+    Connect to a Multibar scheduling tasks remotely, run its tasks one at a time until the connection closes.
+    :param address: (host, port) the Multibar is listening on
+    :param authkey: bytes: shared secret given to the Multibar
+    """
+    conn = Client(address, authkey=authkey)
+    try:
+        while True:
+            try:
+                kind, *message = conn.recv()
+            except (EOFError, OSError):
+                return
+            if kind == 'init':
+                init_worker(*message)
+            elif kind == 'task':
+                run_agent_task(conn, *message)
+    finally:
+        conn.close()
+        get_worker_context().close()
+
+
+def run_agent_task(conn, func, args, kwds):
+    if 'pbar' in kwds:
+        kwds['pbar']._set_pipe(AgentPipe(conn))
+    try:
+        result = (True, func(*args, **kwds))
+    except Exception as e:
+        tb = ''.join(format_exception(*exc_info()))
+        result = (False, (e, tb))
+    try:
+        conn.send(('result', result))
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        # the result or exception could not be pickled
+        conn.send(('result', (False, (RemoteTraceback(repr(e)), ''.join(format_exception(*exc_info()))))))
@@ -0,0 +1,125 @@
+from time import perf_counter
+from PyQt5 import QtCore
+
+from multiprogressbars.helpers.multibar_core import MultibarCore
+from multiprogressbars.helpers.protocol import Messages, read_frame
+from multiprogressbars.helpers.recording import read_recording
+from multiprogressbars.helpers.task_store import TaskStore
+
+
+class ReplayCore(MultibarCore):
+    """
+    Replays a recording of a run (see recording.EventRecorder) in the window of a MultibarCore, without running tasks.
+    Recorded updates go through the same slots as live updates (throttling, formatting, monitor), so a replay
+    reproduces the load on the GUI of the recorded run. Pausing all tasks (space) pauses the replay.
+    """
+    def __init__(self, path, speed=1.0, title=None, autoscroll=True, quit_on_finished=False,
+                 max_bar_update_frequency=0.02, headless=False, monitor_address=None, monitor_authkey=None):
+        """
+        :param speed: multiple of the recorded speed, or None to replay one frame per event loop iteration
+        """
+        self.path = path
+        self.speed = speed
+        self.entries = read_recording(path)
+        self.next_entry = None
+        # position in the recording (s)
+        self.replay_time = 0
+        self.last_tick = None
+        self.start_time = None
+        super().__init__(
+            title=f'Replay: {path}' if title is None else title, batch_size=1, autoscroll=autoscroll,
+            quit_on_finished=quit_on_finished, max_bar_update_frequency=max_bar_update_frequency,
+            headless=headless, monitor_address=monitor_address, monitor_authkey=monitor_authkey)
+
+        self.replay_timer = QtCore.QTimer()
+        self.replay_timer.setSingleShot(True)
+        self.replay_timer.timeout.connect(self.replay_next)
+
+    def create_pool(self, *args):
+        return None  # no tasks are run
+
+    def begin_processing(self):
+        if not self.headless:
+            self.scroll_area.show()
+        self.app.processEvents()
+        self.start_time = self.last_tick = perf_counter()
+        self.replay_timer.start(0)
+        self.app.exec()
+
+    def pause_all_tasks(self):
+        self.all_paused = not self.all_paused
+        if not self.all_paused:
+            self.last_tick = perf_counter()
+            self.replay_timer.start(0)
+
+    def replay_next(self):
+        """
+        Apply the frames that are due, then wait until the next one is.
+        """
+        if self.all_paused:
+            return
+        now = perf_counter()
+        if self.speed is not None:
+            self.replay_time += (now - self.last_tick) * self.speed
+        self.last_tick = now
+
+        while True:
+            if self.next_entry is None:
+                self.next_entry = next(self.entries, None)
+                if self.next_entry is None:
+                    self.replay_finished()
+                    return
+            timestamp, frame = self.next_entry
+            if self.speed is not None and timestamp > self.replay_time:
+                self.replay_timer.start(int(1000 * (timestamp - self.replay_time) / self.speed))
+                return
+            self.next_entry = None
+            for opcode, pid, bar_index, value in read_frame(frame):
+                self.apply_record(opcode, pid, bar_index, value)
+            if self.speed is None:
+                # the frame is drawn before the next one is applied
+                self.replay_timer.start(0)
+                return
+
+    def replay_finished(self):
+        print(f'Replayed {self.path} in {perf_counter() - self.start_time:.2f} s')
+        self.allProcessesFinished.emit()
+
+    def apply_record(self, opcode, pid, bar_index, value):
+        if opcode == Messages.cleared:
+            self.new_batch()
+            return
+        if opcode == Messages.released:
+            self.release_task(pid)
+            return
+        if pid not in self.pbars:
+            self.add_bars(pid)
+        if bar_index > 0:
+            self.update_sub_bar(pid, bar_index, opcode, value)
+        elif opcode == Messages.name:
+            self.update_name(pid, value)
+        elif opcode == Messages.total:
+            self.update_total(pid, value)
+        elif opcode == Messages.value:
+            if self.store.state[pid] == TaskStore.PENDING:
+                # recordings made before the start of tasks was recorded
+                self.set_task_state(pid, TaskStore.RUNNING)
+            self.update_value(pid, value)
+        elif opcode == Messages.state and value < 0:
+            # pending, running or on hold
+            self.set_task_state(pid, int(value))
+        elif opcode == Messages.state:
+            self.finish_bar(pid, int(value))
+            self.end_task(pid, int(value))
+            self.scroll_down()
+        elif opcode == Messages.paused:
+            self.pbars[pid].paused = bool(value)
+            self.publish(Messages.paused, pid, value)
+
+    def add_bars(self, pid):
+        # bars are added in order of task id (or take the id of a released task), their name and total are the next
+        # records for them
+        new_ids = [pid] if pid < len(self.store) else range(len(self.store), pid + 1)
+        for i in new_ids:
+            self.add_task_pbar(i, '', 1)
+            self.add_connections(i)
@@ -0,0 +1,166 @@
+import os
+import pickle
+from hashlib import sha256
+from types import CodeType, FunctionType, ModuleType
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    Persistent journal of task results, stored as one pickle file per task in 'cache_dir'.
+    Entries are keyed by a hash of the function identity and its arguments, so a rerun can skip finished tasks.
+    The least recently used entries are evicted when the directory exceeds 'max_bytes' or 'max_entries'.
+    """
+    suffix = '.pkl'
+    # globals of these types are part of the identity of the functions that refer to them
+    plain_types = (bool, int, float, complex, str, bytes, type(None))
+
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key: file size, ordered from least to most recently used
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.load_index()
+
+    def load_index(self):
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    @classmethod
+    def get_key(cls, func, func_args, func_kwargs, upstream_keys=()):
+        """
+        Hash of the function identity (see 'get_func_identity', so edits to it invalidate the cache) and its arguments.
+        :param upstream_keys: keys of the tasks whose results are passed to this task
+        :return: str: hex digest, or None if the arguments (or any upstream task) cannot be hashed
+        """
+        if None in upstream_keys:
+            return None
+        try:
+            data = pickle.dumps((cls.get_func_identity(func), tuple(func_args), sorted(func_kwargs.items()),
+                                 list(upstream_keys)), protocol=4)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return None
+        return sha256(data).hexdigest()
+
+    @classmethod
+    def get_func_identity(cls, func, seen=None):
+        """
+        What a function's result depends on besides its arguments:
+        its name, its bytecode and constants (including those of the functions defined in it), its default arguments,
+        the contents of its closure, and the globals it refers to that are functions (recursively) or plain values
+        (numbers, strings, bytes). Other globals, e.g. objects or imported modules, are not covered.
+        :return: tuple, to be pickled
+        """
+        seen = set() if seen is None else seen
+        name = (getattr(func, '__module__', None), getattr(func, '__qualname__', repr(func)))
+        code = getattr(func, '__code__', None)
+        if code is None or id(func) in seen:
+            return name
+        seen.add(id(func))
+
+        closure = tuple(cls.get_value_identity(cls.get_cell_contents(cell), seen)
+                        for cell in getattr(func, '__closure__', None) or ())
+        func_globals = getattr(func, '__globals__', dict())
+        global_values = []
+        for global_name in sorted(cls.get_code_names(code)):
+            if global_name in func_globals:
+                value = func_globals[global_name]
+                if isinstance(value, FunctionType) or isinstance(value, cls.plain_types):
+                    global_values.append((global_name, cls.get_value_identity(value, seen)))
+        return (name, cls.get_code_identity(code), getattr(func, '__defaults__', None),
+                getattr(func, '__kwdefaults__', None), closure, tuple(global_values))
+
+    @classmethod
+    def get_value_identity(cls, value, seen):
+        if isinstance(value, FunctionType):
+            return cls.get_func_identity(value, seen)
+        if isinstance(value, ModuleType):
+            return 'module', value.__name__
+        return value
+
+    @classmethod
+    def get_code_identity(cls, code):
+        consts = tuple(cls.get_code_identity(const) if isinstance(const, CodeType) else const
+                       for const in code.co_consts)
+        return code.co_code, consts, code.co_names
+
+    @classmethod
+    def get_code_names(cls, code):
+        """
+        :return: set[str]: global (and attribute) names used by the code and the code defined in it
+        """
+        names = set(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, CodeType):
+                names |= cls.get_code_names(const)
+        return names
+
+    @staticmethod
+    def get_cell_contents(cell):
+        try:
+            return cell.cell_contents
+        except ValueError:
+            return None  # the closure variable has not been assigned yet
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}{self.suffix}')
+
+    def get(self, key):
+        """
+        :return: tuple[found: bool, result]
+        """
+        if key is None or key not in self.entries:
+            return False, None
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except Exception:
+            # missing or partially written entry
+            self.remove(key)
+            return False, None
+        os.utime(path)
+        self.entries.move_to_end(key)
+        return True, result
+
+    def put(self, key, result):
+        if key is None:
+            return
+        try:
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        path = self.get_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        # atomic, so a crash never leaves a truncated entry behind
+        os.replace(tmp_path, path)
+
+        self.total_bytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self.evict()
+
+    def remove(self, key):
+        self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(self.get_path(key))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        while len(self.entries) > 1 and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                (self.max_bytes is not None and self.total_bytes > self.max_bytes)):
+            key = next(iter(self.entries))
+            self.remove(key)
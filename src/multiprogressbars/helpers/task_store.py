@@ -0,0 +1,132 @@
+from time import time
+from array import array
+
+
+class TaskStore:
+    """
+    Numeric state of every task of a batch, held in one compact array per field (indexed by task id).
+    The scheduler reads values, states and timings from here, and the bars format their labels from them.
+    The tasks yet to finish are followed by the scheduler (which holds their handlers, see MultibarCore), and its
+    queries (e.g. the expected durations of the running tasks) are given their ids, so they don't go over the tasks
+    that have finished. The ids of the finished tasks are indexed by state here, for the results.
+    States are the ProcessHandler exit codes once a task has finished, and the negative codes below before then.
+    A finished task keeps its state (e.g. a cancelled task whose worker returns a result later).
+    """
+    PENDING = -1
+    RUNNING = -2
+    ON_HOLD = -3
+
+    # weight of the latest rate in the smoothed rate of each task
+    rate_smoothing = 0.3
+
+    def __init__(self, max_update_frequency=0.02):
+        self.max_update_frequency = max_update_frequency
+        self.clear()
+
+    def __len__(self):
+        return len(self.state)
+
+    def clear(self):
+        self.value = array('d')
+        self.total = array('d')
+        self.state = array('b')
+        self.start_time = array('d')
+        self.last_updated = array('d')
+        # smoothed items per second
+        self.rate = array('d')
+        # finished state: set of the ids of the tasks that finished with it
+        self.pids_by_state = dict()
+        # highest task id that has finished successfully
+        self.max_finished = -1
+
+    def add(self, total, pid=None):
+        """
+        :param pid: id of a released task, whose row is reused (a new id is given otherwise)
+        :return: int: task id
+        """
+        if pid is not None and pid < len(self.state):
+            if self.is_finished(pid):
+                self.pids_by_state[self.state[pid]].discard(pid)
+            self.value[pid] = 0
+            self.total[pid] = total
+            self.state[pid] = self.PENDING
+            self.start_time[pid] = self.last_updated[pid] = self.rate[pid] = 0
+            return pid
+        self.value.append(0)
+        self.total.append(total)
+        self.state.append(self.PENDING)
+        self.start_time.append(0)
+        self.last_updated.append(0)
+        self.rate.append(0)
+        return len(self.state) - 1
+
+    def is_finished(self, pid):
+        return self.state[pid] >= 0
+
+    def set_state(self, pid, state):
+        if self.is_finished(pid):
+            return
+        if state == self.RUNNING and self.state[pid] == self.PENDING:
+            self.start_time[pid] = self.last_updated[pid] = time()
+        self.state[pid] = state
+        if state >= 0:
+            self.pids_by_state.setdefault(state, set()).add(pid)
+        if state == 0 and pid > self.max_finished:
+            self.max_finished = pid
+
+    def set_total(self, pid, total):
+        self.total[pid] = total
+
+    def allowed_to_set_value(self, pid, value):
+        """
+        Throttle of the bar updates: at most one per 'max_update_frequency' seconds, of at least 1/500 of the total
+        """
+        return (time() - self.last_updated[pid] >= self.max_update_frequency and
+                value - self.value[pid] >= self.total[pid] // 500)
+
+    def set_value(self, pid, value):
+        now = time()
+        elapsed = now - self.last_updated[pid]
+        if elapsed > 0 and self.state[pid] == self.RUNNING:
+            rate = (value - self.value[pid]) / elapsed
+            self.rate[pid] = rate if self.rate[pid] == 0 else \
+                self.rate_smoothing * rate + (1 - self.rate_smoothing) * self.rate[pid]
+        self.value[pid] = value
+        self.last_updated[pid] = now
+
+    def get_pids(self, *states):
+        """
+        :param states: exit codes of finished tasks
+        :return: list[int]: ids of the tasks that finished with any of the given states, in order
+        """
+        return sorted(pid for state in states for pid in self.pids_by_state.get(state, ()))
+
+    def get_remaining_time(self, pid, now=None):
+        """
+        Remaining time of the task, extrapolated at its smoothed rate from its last update.
+        A task without a rate yet has a remaining time of 0.
+        """
+        if self.rate[pid] <= 0:
+            return 0
+        if now is None:
+            now = time()
+        return max((self.total[pid] - self.value[pid]) / self.rate[pid] - (now - self.last_updated[pid]), 0)
+
+    def get_elapsed_time(self, pid):
+        """
+        Time from the start of the task to its last update (0 for a task that never ran, e.g. a journaled one).
+        """
+        if self.start_time[pid] == 0:
+            return 0
+        return self.last_updated[pid] - self.start_time[pid]
+
+    def get_expected_durations(self, pids):
+        """
+        :param pids: ids of the running tasks
+        :return: dict[pid, float]: time since each of the tasks started plus its remaining time
+        """
+        now = time()
+        return {pid: now - self.start_time[pid] + self.get_remaining_time(pid, now) for pid in pids}
+
+    def get_duration(self, pid):
+        return time() - self.start_time[pid]
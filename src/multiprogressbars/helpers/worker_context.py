@@ -0,0 +1,58 @@
+from sys import exc_info, stderr
+from traceback import format_exception
+from multiprocessing.util import Finalize
+
+from multiprogressbars.helpers.affinity import pin_worker
+
+
+class WorkerContext:
+    """
+    Per-worker state shared by every task that is run by the same worker process.
+    Attributes can be set freely, e.g. 'context.model = load_model()', and persist between tasks on that worker.
+    Teardown callbacks are run in reverse order when the worker exits (e.g. when recycled by 'maxtasksperchild').
+    """
+    def __init__(self):
+        self._teardown_funcs = []
+        self.closed = False
+
+    def add_teardown(self, func, *args, **kwargs):
+        """
+        Register a callback to release a resource held by the context when the worker exits.
+        :param func: callable run as 'func(*args, **kwargs)' on teardown
+        """
+        self._teardown_funcs.append((func, args, kwargs))
+
+    def close(self):
+        while len(self._teardown_funcs) > 0:
+            func, args, kwargs = self._teardown_funcs.pop()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                print(f'----- EXCEPTION RAISED IN WORKER CONTEXT TEARDOWN: {func} -----', file=stderr)
+                [print(arg.replace('\n\n', '\n'), file=stderr) for arg in format_exception(*exc_info())]
+        self.closed = True
+
+
+_worker_context = None
+
+
+def get_worker_context():
+    global _worker_context
+    if _worker_context is None or _worker_context.closed:
+        _worker_context = WorkerContext()
+        # finalizers with an exit priority are run by multiprocessing when the worker process exits cleanly
+        Finalize(_worker_context, _worker_context.close, exitpriority=10)
+    return _worker_context
+
+
+def init_worker(initializer=None, initargs=(), placement=None):
+    """
+    Pool initializer: creates the worker context and passes it to the user initializer as the first argument.
+    :param placement: affinity.CorePlacement of the cores to pin the workers to
+    """
+    if placement is not None:
+        # pinned first, so that whatever the initializer allocates is local to the worker's core
+        pin_worker(placement)
+    context = get_worker_context()
+    if initializer is not None:
+        initializer(context, *initargs)
@@ -6,13 +6,60 @@ class Multibar:
     Object for adding tasks, processing tasks, and collecting results.
     """
     def __init__(self, title=None, batch_size=None, autoscroll=True,
-                 quit_on_finished=True, max_bar_update_frequency=0.02):
+                 quit_on_finished=True, max_bar_update_frequency=0.02,
+                 initializer=None, initargs=(), maxtasksperchild=None,
+                 cache_dir=None, cache_max_bytes=None, cache_max_entries=None,
+                 remote_address=None, authkey=None, headless=False, monitor_address=None, monitor_authkey=None,
+                 default_timeout=None, speculative=False, straggler_factor=2.0, straggler_check_frequency=1.0,
+                 record_path=None, affinity=None):
+        """
+        :param title: window title (defaults to the name of the first task function)
+        :param batch_size: number of worker processes (defaults to the cpu count)
+        :param autoscroll: keep the running tasks visible
+        :param quit_on_finished: close the window once all tasks are finished
+        :param max_bar_update_frequency: minimum time (s) between redrawing a progress bar
+        :param initializer: called once per worker process as 'initializer(context, *initargs)'.
+            The context is available to tasks as 'pbar.context' and is shared by all tasks on that worker.
+        :param initargs: tuple: extra arguments of the initializer
+        :param maxtasksperchild: tasks a worker completes before it is replaced (its context is torn down)
+        :param cache_dir: directory journaling finished results, keyed by a hash of the function and its arguments.
+            Tasks with a journaled result are not run again and are shown as complete.
+        :param cache_max_bytes: evict the least recently used results once the journal exceeds this size
+        :param cache_max_entries: evict the least recently used results once the journal exceeds this many entries
+        :param remote_address: (host, port) to listen on for worker agents on other hosts (see multiprogressbars.agent).
+            Tasks are then run by the connected agents instead of a local pool, 'batch_size' should match their number.
+        :param authkey: bytes: shared secret that agents must present to connect
+        :param headless: run without showing a window (e.g. without a display), usually with a 'monitor_address'
+        :param monitor_address: (host, port) to publish progress on, for viewers to attach to (see multiprogressbars.viewer).
+            Viewers can detach and reattach at any time without affecting the run.
+        :param monitor_authkey: bytes: shared secret that viewers must present to attach
+        :param default_timeout: wall-clock time (s) after which a task is stopped and marked as timed out,
+            for tasks added without their own 'timeout'
+        :param speculative: once no tasks are waiting to start, run a duplicate of each straggling task on an idle
+            worker and keep whichever finishes first. Only suitable for tasks without side effects.
+        :param straggler_factor: a task is a straggler if its elapsed plus remaining time is more than this many times
+            the median duration of the finished tasks
+        :param straggler_check_frequency: time (s) between looking for stragglers to duplicate
+        :param record_path: file to record every progress update and state change to, to replay them later
+            without running the tasks (see multiprogressbars.replay)
+        :param affinity: pin each worker process to its own core (Linux only, local pool only):
+            'compact' fills the cores of one NUMA node (socket) before the next, 'spread' takes a core of each node in
+            turn, or a list of cores. Lowering the number of processes puts the tasks on the last of these cores on
+            hold first, and raising it resumes the tasks on the first cores first.
+        """
         self._mbar = MultibarCore(
             title=title, batch_size=batch_size, autoscroll=autoscroll, quit_on_finished=quit_on_finished,
-            max_bar_update_frequency=max_bar_update_frequency)
+            max_bar_update_frequency=max_bar_update_frequency,
+            initializer=initializer, initargs=initargs, maxtasksperchild=maxtasksperchild,
+            cache_dir=cache_dir, cache_max_bytes=cache_max_bytes, cache_max_entries=cache_max_entries,
+            remote_address=remote_address, authkey=authkey,
+            headless=headless, monitor_address=monitor_address, monitor_authkey=monitor_authkey,
+            default_timeout=default_timeout, speculative=speculative, straggler_factor=straggler_factor,
+            straggler_check_frequency=straggler_check_frequency, record_path=record_path, affinity=affinity)
         self._running = False
 
-    def add_task(self, func: callable, func_args: tuple = (), func_kwargs: dict = None, desc='', total=1):
+    def add_task(self, func: callable, func_args: tuple = (), func_kwargs: dict = None, desc='', total=1,
+                 depends_on=None, timeout=None):
         """
         Add a task to be processed and monitored. Processing is not started until requested.
         Tasks are created as a QThread object, the processing is executed using a multiprocessing.Pool object.
@@ -22,8 +69,38 @@ class Multibar:
         :param func_kwargs: dict: kwargs of the function to be called
         :param desc: Progress bar label
         :param total: Total iterations expected within the task
+        :param depends_on: list of task ids (returned by previous calls) that must finish before this task starts.
+            Their results are passed to the function as the kwarg 'upstream_results: dict[task_id, result]'.
+            If any of them fails or is cancelled, this task is not run.
+        :param timeout: wall-clock time (s) after which the task is stopped and marked as timed out
+            (defaults to the Multibar's 'default_timeout'). The worker stops at the task's next progress update.
+        :return: int: task id
+        """
+        return self._mbar.add_task(func, func_args, func_kwargs, desc, total, depends_on, timeout)
+
+    def add_range_task(self, func: callable, start: int, stop: int, reduce: callable = None, func_args: tuple = (),
+                       func_kwargs: dict = None, desc='', depends_on=None, timeout=None, min_chunk_size=1):
+        """
+        Add a task over the items [start, stop), which is split onto idle workers while it runs.
+        It starts as a single chunk. Whenever a worker is idle and no other task can start, a running chunk hands the
+        second half of its remaining items to a new chunk on that worker. Progress of all chunks is shown on one bar.
+
+        :param func: Function called for each chunk as 'func(items, *func_args, pbar=pbar, **func_kwargs)',
+            where 'items' yields the indices of the chunk. It must iterate 'items' to be split.
+        :param start: int: first item
+        :param stop: int: end of the range (exclusive)
+        :param reduce: combines two partial results, e.g. 'operator.add', applied to the chunks' results in the order
+            of the range. The result is the list of the chunks' results if not given.
+        :param func_args: tuple: extra args of the function
+        :param func_kwargs: dict: kwargs of the function
+        :param desc: Progress bar label
+        :param depends_on: list of task ids that must finish first (see 'add_task')
+        :param timeout: wall-clock time (s) after which all of the task's chunks are stopped
+        :param min_chunk_size: int: a chunk is never split into chunks of fewer items
+        :return: int: task id
         """
-        self._mbar.add_task(func, func_args, func_kwargs, desc, total)
+        return self._mbar.add_range_task(func, start, stop, reduce, func_args, func_kwargs, desc, depends_on, timeout,
+                                         min_chunk_size)
 
     def begin_processing(self):
         """
@@ -43,5 +120,57 @@ class Multibar:
             self._mbar.begin_processing()
         return self._mbar.get_results()
 
-    def close(self):
-        self._mbar.close()
\ No newline at end of file
+    def close(self, mode='abort', timeout=5.0):
+        """
+        Stop processing and release the worker pool.
+        :param mode: 'abort' cancels any running tasks immediately,
+            'drain' lets them finish (their results are kept) and cancels the tasks that have not started
+        :param timeout: bound (s) on the total time spent waiting for tasks, after which a drain is aborted
+        """
+        self._mbar.close(mode, timeout)
+
+
+class MultibarSession(Multibar):
+    """
+    Long-lived Multibar that keeps the worker pool and the window alive across several batches of tasks.
+    Tasks added after the previous batch was collected form a new batch, which clears the previous batch's bars.
+    """
+    def __init__(self, title=None, **kwargs):
+        """
+        Takes the parameters of the Multibar, except 'quit_on_finished'.
+        """
+        # the event loop returns once each batch has finished, so that the next batch can be added
+        kwargs['quit_on_finished'] = True
+        super().__init__(title=title, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def add_task(self, func: callable, func_args: tuple = (), func_kwargs: dict = None, desc='', total=1,
+                 depends_on=None, timeout=None):
+        if self._running:
+            # the previous batch has been processed, start a new one
+            self._mbar.new_batch()
+            self._running = False
+        return super().add_task(func, func_args, func_kwargs, desc, total, depends_on, timeout)
+
+    def add_range_task(self, func: callable, start: int, stop: int, reduce: callable = None, func_args: tuple = (),
+                       func_kwargs: dict = None, desc='', depends_on=None, timeout=None, min_chunk_size=1):
+        if self._running:
+            self._mbar.new_batch()
+            self._running = False
+        return super().add_range_task(func, start, stop, reduce, func_args, func_kwargs, desc, depends_on, timeout,
+                                      min_chunk_size)
+
+    def get(self):
+        """
+        Process the current batch and collect its results.
+        Call is blocking until the batch's tasks are executed or cancelled (or the window closed).
+        :return: list[results: dict, failed_tasks: dict] of the current batch only
+        """
+        if not self._running:
+            self.begin_processing()
+        return self._mbar.get_results()
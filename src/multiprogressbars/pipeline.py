@@ -0,0 +1,68 @@
+from multiprogressbars.helpers.pipeline_core import PipelineCore, Stage
+
+
+class Pipeline:
+    """
+    Object for streaming items through a chain of stages, e.g. a CPU-bound map followed by I/O-bound writes.
+    Each stage has its own workers, and starts on an item as soon as the previous stage has produced it.
+    """
+    ProcessExecutor = Stage.ProcessExecutor
+    ThreadExecutor = Stage.ThreadExecutor
+
+    def __init__(self, title=None, autoscroll=True, quit_on_finished=True, max_bar_update_frequency=0.02,
+                 initializer=None, initargs=(), headless=False, monitor_address=None, monitor_authkey=None,
+                 default_timeout=None, record_path=None):
+        """
+        :param title: window title (defaults to the names of the stages)
+        :param initializer: called once per worker process of the 'process' stages, as for the Multibar
+        :param initargs: tuple: extra arguments of the initializer
+        The other parameters are as for the Multibar.
+        """
+        self._pipeline = PipelineCore(
+            title=title, autoscroll=autoscroll, quit_on_finished=quit_on_finished,
+            max_bar_update_frequency=max_bar_update_frequency, initializer=initializer, initargs=initargs,
+            headless=headless, monitor_address=monitor_address, monitor_authkey=monitor_authkey,
+            default_timeout=default_timeout, record_path=record_path)
+        self._ran = False
+
+    def add_stage(self, func: callable, workers: int = 1, executor: str = ProcessExecutor, queue_size: int = None,
+                  func_args: tuple = (), func_kwargs: dict = None, desc='', total=1, timeout=None):
+        """
+        Add a stage after the stages added so far.
+
+        :param func: Function called for each item as 'func(item, *func_args, pbar=pbar, **func_kwargs)', where 'item'
+            is an input of the pipeline for the first stage, and the item's result of the previous stage otherwise
+        :param workers: int: number of items the stage processes at once
+        :param executor: 'process' runs the stage on its own pool of processes (for CPU-bound work),
+            'thread' on a pool of threads of this process (for I/O-bound work, the function need not be picklable)
+        :param queue_size: int: most items waiting for this stage, before the previous stage waits for room
+            (defaults to twice the workers)
+        :param func_args: tuple: extra args of the function
+        :param func_kwargs: dict: kwargs of the function
+        :param desc: name of the stage, shown on its bars (defaults to the function's name)
+        :param total: Total iterations expected within the function, per item
+        :param timeout: wall-clock time (s) after which an item's task is stopped and the item dropped
+        :return: int: stage index
+        """
+        return self._pipeline.add_stage(func, workers, executor, queue_size, func_args, func_kwargs, desc, total,
+                                        timeout)
+
+    def run(self, items):
+        """
+        Stream the items through the stages, taking them from 'items' only as the first stage has room for them.
+        Call is blocking until all items are processed or dropped (or the window closed).
+        :param items: iterable of the inputs of the first stage
+        :return: list[results: dict[item index, result of the last stage],
+                      failed_items: dict[item index, (stage index, exit code)]]
+        """
+        if self._ran:
+            raise RuntimeError('A pipeline can only be run once')
+        self._ran = True
+        self._pipeline.run(items)
+        return self._pipeline.get_results()
+
+    def close(self, mode='abort', timeout=5.0):
+        """
+        Stop processing and release the workers of all stages (see Multibar.close).
+        """
+        self._pipeline.close(mode, timeout)
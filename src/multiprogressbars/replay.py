@@ -0,0 +1,29 @@
+from multiprogressbars.helpers.replay_core import ReplayCore
+
+
+def run_replay(path, speed=1.0, max_bar_update_frequency=0.02, quit_on_finished=False):
+    """
+    Replay a recording of a Multibar created with a 'record_path', in the same window, without running any tasks.
+    Blocking until the window is closed (or the replay has finished, if 'quit_on_finished').
+    :param path: recording file
+    :param speed: multiple of the recorded speed, or None to replay it as fast as the window can draw it
+    :param max_bar_update_frequency: minimum time (s) between redrawing a progress bar, as for the Multibar
+    """
+    replay = ReplayCore(path, speed=speed, quit_on_finished=quit_on_finished,
+                        max_bar_update_frequency=max_bar_update_frequency)
+    replay.begin_processing()
+    replay.close()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Replay the progress recorded by a Multibar")
+    parser.add_argument("path", help="Recording file given to the Multibar as 'record_path'")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Multiple of the recorded speed, 0 to replay as fast as the window can draw it")
+    parser.add_argument("--max-bar-update-frequency", type=float, default=0.02,
+                        help="Minimum time (s) between redrawing a progress bar")
+    parser.add_argument("--quit", action='store_true', help="Close the window once the replay has finished")
+
+    args = parser.parse_args()
+    run_replay(args.path, args.speed if args.speed > 0 else None, args.max_bar_update_frequency, args.quit)
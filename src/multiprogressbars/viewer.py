@@ -0,0 +1,22 @@
+from multiprogressbars.helpers.monitor import MonitorViewer
+
+
+def run_viewer(address, authkey):
+    """
+    Attach a window to a Multibar that was created with a 'monitor_address'. Blocking until the window is closed.
+    :param address: (host, port) the Multibar is publishing its progress on
+    :param authkey: bytes: shared secret given to the Multibar as 'monitor_authkey'
+    """
+    viewer = MonitorViewer(address, authkey)
+    viewer.exec()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser(description="Attach to a Multibar's progress monitor")
+    parser.add_argument("--host", default='localhost', help="Host the Multibar is publishing on")
+    parser.add_argument("--port", type=int, required=True, help="Port the Multibar is publishing on")
+    parser.add_argument("--authkey", required=True, help="Shared secret given to the Multibar as 'monitor_authkey'")
+
+    args = parser.parse_args()
+    run_viewer((args.host, args.port), args.authkey.encode())
@@ -0,0 +1,4 @@
+import os
+
+# the Multibar is run without a display in tests
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
@@ -0,0 +1,10 @@
+"""
+Task functions shared by the tests. They are defined in a module of their own, so the workers can import them.
+"""
+import time
+
+
+def sleep_loop(count, delay, pbar=None):
+    for i in pbar(range(count), total=count):
+        time.sleep(delay)
+    return count
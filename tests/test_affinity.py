@@ -0,0 +1,101 @@
+import os
+import time
+
+import pytest
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers import affinity
+from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.affinity import CorePlacement, parse_cpulist, format_cpulist, get_worker_core
+
+
+@pytest.mark.parametrize('text, cpus', [
+    ('0', [0]),
+    ('0-3', [0, 1, 2, 3]),
+    ('0-3,8-11', [0, 1, 2, 3, 8, 9, 10, 11]),
+    ('1,3,5-6\n', [1, 3, 5, 6]),
+    ('', []),
+])
+def test_parse_cpulist(text, cpus):
+    assert parse_cpulist(text) == cpus
+
+
+@pytest.mark.parametrize('cpus, text', [
+    ([0], '0'),
+    ([3, 1, 2, 0], '0-3'),
+    ([0, 1, 2, 3, 8], '0-3,8'),
+    ([1, 3, 5, 6], '1,3,5-6'),
+    ([], ''),
+])
+def test_format_cpulist(cpus, text):
+    assert format_cpulist(cpus) == text
+    assert parse_cpulist(format_cpulist(cpus)) == sorted(cpus)
+
+
+@pytest.fixture
+def two_sockets(monkeypatch):
+    # cpus 0-3 on node 0 and 4-7 on node 1
+    monkeypatch.setattr(os, 'sched_getaffinity', lambda pid: set(range(8)))
+    monkeypatch.setattr(affinity, 'get_numa_nodes', lambda cpus: {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]})
+
+
+def test_compact_fills_a_node_before_the_next(two_sockets):
+    assert CorePlacement(CorePlacement.Compact, 6).cores == [0, 1, 2, 3, 4, 5]
+
+
+def test_spread_alternates_between_nodes(two_sockets):
+    assert CorePlacement(CorePlacement.Spread, 6).cores == [0, 4, 1, 5, 2, 6]
+
+
+def test_more_workers_than_cores_share_them_in_turn(two_sockets):
+    assert CorePlacement([2, 5], 5).cores == [2, 5, 2, 5, 2]
+
+
+def test_invalid_placements_are_rejected(two_sockets):
+    with pytest.raises(ValueError):
+        CorePlacement([8], 1)
+    with pytest.raises(ValueError):
+        CorePlacement('scatter', 1)
+
+
+def test_rank_follows_the_order_of_the_cores(two_sockets):
+    placement = CorePlacement(CorePlacement.Spread, 4)
+    assert [placement.rank(core) for core in [0, 4, 1, 5, None]] == [0, 1, 2, 3, 4]
+
+
+def test_the_core_of_an_exited_worker_is_claimed_again(two_sockets):
+    placement = CorePlacement(CorePlacement.Compact, 2)
+    dead_pid = os.fork()
+    if dead_pid == 0:
+        os._exit(0)
+    os.waitpid(dead_pid, 0)
+    placement.owners[0] = dead_pid
+    placement.owners[1] = os.getppid()
+    assert placement.claim_core() == 0
+    assert placement.claim_core() is None
+
+
+def core_and_pid(pbar=None):
+    return get_worker_core(), os.getpid()
+
+
+def hang(seconds, pbar=None):
+    time.sleep(seconds)
+
+
+def test_the_worker_replacing_a_killed_worker_is_pinned_to_its_core(monkeypatch):
+    monkeypatch.setattr(ProcessHandler, 'stop_timeout', 0.2)
+    core = sorted(os.sched_getaffinity(0))[0]
+    mbar = Multibar(batch_size=1, headless=True, affinity=[core])
+    # the stuck worker is killed after the timeout
+    first = mbar.add_task(core_and_pid)
+    mbar.add_task(hang, (30,), timeout=0.3)
+    last = mbar.add_task(core_and_pid)
+    start = time.time()
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert list(failed) == [1]
+    assert results[first][0] == core and results[last][0] == core
+    assert results[last][1] != results[first][1]
+    assert time.time() - start < 10
@@ -0,0 +1,175 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pipe
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.bar_updater import BarUpdater
+from multiprogressbars.helpers.protocol import Messages, read_frame
+
+
+def sent_records(conn):
+    records = []
+    while conn.poll():
+        records.extend((opcode, value) for opcode, _, _, value in read_frame(conn.recv_bytes()))
+    return records
+
+
+def test_iterating_sets_the_value_to_the_item_yielded():
+    parent, child = Pipe()
+    pbar = BarUpdater()
+    pbar._set_pipe(child)
+
+    iterator = pbar([2, 4, 8], desc='doubling', total=8)
+    assert list(iterator) == [2, 4, 8]
+
+    records = sent_records(parent)
+    assert records[:2] == [(Messages.name, 'doubling'), (Messages.total, 8)]
+    assert [value for opcode, value in records if opcode == Messages.value][-1] == 8
+
+
+def test_the_generator_returns_the_last_item():
+    parent, child = Pipe()
+    pbar = BarUpdater()
+    pbar._set_pipe(child)
+
+    iterator = pbar(range(5))
+    try:
+        while True:
+            next(iterator)
+    except StopIteration as stop:
+        assert stop.value == 4
+
+
+def test_sub_bars_send_their_records_over_the_tasks_connection():
+    parent, child = Pipe()
+    pbar = BarUpdater()
+    pbar._task_id = 7
+    pbar._set_pipe(child)
+
+    loading = pbar.add_subbar(desc='load', total=2)
+    computing = pbar.add_subbar(desc='compute')
+    list(loading([1, 2]))
+    computing.update_value(5)
+    # as run_task does when the task returns
+    pbar._flush()
+
+    records = []
+    while parent.poll():
+        records.extend(read_frame(parent.recv_bytes()))
+    assert (Messages.name, 7, 1, 'load') in records and (Messages.total, 7, 1, 2) in records
+    assert (Messages.name, 7, 2, 'compute') in records
+    assert [value for opcode, _, index, value in records if opcode == Messages.value and index == 1][-1] == 2
+    assert [value for opcode, _, index, value in records if opcode == Messages.value and index == 2][-1] == 5
+
+
+def phases(pbar=None):
+    for name, total in [('load', 3), ('compute', 5)]:
+        for _ in pbar.add_subbar(desc=name, total=total)(range(total)):
+            time.sleep(0.005)
+    return 'done'
+
+
+def sleep_only(pbar=None):
+    time.sleep(0.01)
+
+
+def test_sub_bars_are_shown_under_their_task():
+    mbar = Multibar(batch_size=1, headless=True)
+    task = mbar.add_task(phases)
+    plain = mbar.add_task(sleep_only)
+    results, failed = mbar.get()
+    pbars = mbar._mbar.pbars
+    sub_bars = {index: (bar.task_name, bar.total, bar.current_value)
+                for index, bar in pbars[task].sub_bar_panel.pbars.items()}
+    mbar.close()
+
+    assert failed == {} and results[task] == 'done'
+    # finished sub-bars are filled, whatever their last update was
+    assert sub_bars == {1: ('load', 3, 3), 2: ('compute', 5, 5)}
+    assert not pbars[plain].has_sub_bars()
+
+
+def test_a_shared_counter_sends_the_total_of_all_threads():
+    parent, child = Pipe()
+    pbar = BarUpdater()
+    pbar._set_pipe(child)
+    pbar.min_send_interval = 0.001
+
+    def count(counter):
+        for _ in range(1000):
+            counter.increment()
+
+    with pbar.shared_counter(desc='threads', total=8000) as counter:
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(count, [counter] * 8))
+        assert pbar._flusher is not None
+    # closing the last counter sends the final value and stops the flusher thread
+    assert pbar._flusher is None
+    assert counter.value == 8000
+
+    records = sent_records(parent)
+    assert records[:2] == [(Messages.name, 'threads'), (Messages.total, 8000)]
+    values = [value for opcode, value in records if opcode == Messages.value]
+    assert values == sorted(values) and values[-1] == 8000
+
+
+def count_in_threads(items, pbar=None):
+    def work(share):
+        return sum(counter(share))
+
+    with pbar.shared_counter(total=items) as counter:
+        with ThreadPoolExecutor(4) as executor:
+            return sum(executor.map(work, [range(i, items, 4) for i in range(4)]))
+
+
+def test_a_shared_counter_reports_the_progress_of_its_task():
+    mbar = Multibar(batch_size=1, headless=True)
+    core = mbar._mbar
+    reported = []
+    original_update_value = core.update_value
+
+    def update_value(pid, value, exit_code=None):
+        if exit_code is None:
+            reported.append(value)
+        original_update_value(pid, value, exit_code)
+
+    core.update_value = update_value
+    task = mbar.add_task(count_in_threads, (500,))
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {} and results[task] == sum(range(500))
+    # the final value was sent by the task, before its bar was filled as finished
+    assert reported[-1] == 500
+
+
+def test_iterating_over_items_that_are_not_numbers_counts_them():
+    parent, child = Pipe()
+    pbar = BarUpdater()
+    pbar._set_pipe(child)
+
+    assert list(pbar(['a.txt', 'b.txt', None], total=3)) == ['a.txt', 'b.txt', None]
+    # as run_task does when the task returns
+    pbar._finish()
+
+    records = sent_records(parent)
+    assert [value for opcode, value in records if opcode == Messages.value][-1] == 3
+
+
+def load_and_compute(paths, pbar=None):
+    # the example of the README
+    loading = pbar.add_subbar(desc='load', total=len(paths))
+    data = [path.upper() for path in loading(paths)]
+    return [item for item in pbar.add_subbar(desc='compute', total=len(data))(data)]
+
+
+def test_sub_bars_follow_items_that_are_not_numbers():
+    mbar = Multibar(batch_size=1, headless=True)
+    task = mbar.add_task(load_and_compute, (['a.csv', 'b.csv', 'c.csv'],))
+    results, failed = mbar.get()
+    sub_bars = {index: (bar.task_name, bar.current_value)
+                for index, bar in mbar._mbar.pbars[task].sub_bar_panel.pbars.items()}
+    mbar.close()
+
+    assert failed == {} and results[task] == ['A.CSV', 'B.CSV', 'C.CSV']
+    assert sub_bars == {1: ('load', 3), 2: ('compute', 3)}
@@ -0,0 +1,46 @@
+import time
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.process_handler import ProcessHandler
+
+from tasks import sleep_loop
+
+
+def start(num_tasks, count, delay):
+    mbar = Multibar(batch_size=2, headless=True)
+    for _ in range(num_tasks):
+        mbar.add_task(sleep_loop, (count, delay), total=count)
+    # started without the event loop, which the close runs itself while draining
+    mbar._mbar.start_ready_tasks()
+    return mbar, mbar._mbar
+
+
+def test_drain_keeps_the_results_of_running_tasks_and_cancels_the_others():
+    mbar, core = start(4, 20, 0.01)
+    time.sleep(0.05)
+    mbar.close('drain', timeout=10)
+
+    assert sorted(core.results) == [0, 1]
+    assert list(core.store.state) == [ProcessHandler.SUCESSFUL] * 2 + [ProcessHandler.CANCELLED] * 2
+    assert core.closed
+
+
+def test_abort_cancels_running_tasks_without_waiting_for_them():
+    mbar, core = start(3, 1000, 0.01)
+    time.sleep(0.05)
+    start_time = time.time()
+    mbar.close('abort', timeout=2)
+
+    assert time.time() - start_time < 3
+    assert core.results == {}
+    assert list(core.store.state) == [ProcessHandler.CANCELLED] * 3
+
+
+def test_a_drain_that_runs_out_of_time_is_aborted():
+    mbar, core = start(2, 1000, 0.01)
+    start_time = time.time()
+    mbar.close('drain', timeout=0.3)
+
+    assert time.time() - start_time < 3
+    assert len(core.running_tasks) == 0 and len(core.pending_tasks) == 0
+    assert all(core.store.is_finished(pid) for pid in range(len(core.store)))
@@ -0,0 +1,93 @@
+from PyQt5 import QtWidgets
+
+from multiprogressbars.helpers.graphics_widgets import LabeledProgressBar, SubProgressBar, ZoomingScrollArea
+from multiprogressbars.helpers.task_store import TaskStore
+
+
+app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+
+def test_the_labels_are_formatted_from_the_store():
+    store = TaskStore()
+    pid = store.add(100)
+    store.set_state(pid, TaskStore.RUNNING)
+    pbar = LabeledProgressBar(total=100, pid=pid, store=store)
+
+    # as set by the MultibarCore, before it sets the bar
+    store.start_time[pid] -= 65
+    store.set_value(pid, 20)
+    store.rate[pid] = 4
+    pbar.set_value(20)
+
+    assert pbar.current_value == 20
+    assert pbar.frequency_label.text() == '  4.0 it/s'
+    assert pbar.elapsed_time_label.text() == '  0:01:05'
+    # 80 items left at 4 per second, the same remaining time the scheduler looks for stragglers with
+    assert pbar.remaining_time_label.text() == '  0:00:20'
+    assert store.get_remaining_time(pid, store.last_updated[pid]) == 20
+
+
+def test_a_bar_without_a_store_keeps_its_own():
+    pbar = SubProgressBar()
+    pbar.set_total(10)
+    pbar.set_value(5)
+
+    assert (pbar.current_value, pbar.total) == (5, 10)
+    assert pbar.store.value[pbar.row] == 5
+    assert pbar.progress_label.text().split('/')[0].strip() == '5.0'
+
+
+def create_window(num_bars):
+    scroll_area, widget, layout = ZoomingScrollArea.create_window('bars')
+    scroll_area.resize(600, 300)
+    pbars = []
+    for row in range(num_bars):
+        pbar = LabeledProgressBar(total=100, name=f'bar {row}', pid=row, parent=widget)
+        pbar.add_to_layout(layout, row)
+        scroll_area.track_bar(pbar)
+        pbars.append(pbar)
+    scroll_area.show()
+    app.processEvents()
+    return scroll_area, pbars
+
+
+def test_only_the_bars_in_view_are_formatted():
+    scroll_area, pbars = create_window(300)
+    first, last = pbars[0], pbars[-1]
+    assert first.in_view and not last.in_view
+    initial_progress = last.progress_label.text()
+    initial_rate = last.frequency_label.text()
+
+    sub_bar = last.get_sub_bar(scroll_area.widget().layout(), 1)
+    for value in range(1, 50):
+        first.set_value(value)
+        last.set_value(value)
+        sub_bar.set_value(value)
+    last.set_total(200)
+
+    assert first.progress_label.text().split('/')[0].strip() == '49.0'
+    # the numeric state of the bar out of view is kept, its labels are left as they were
+    assert last.value() == 49 and last.maximum() == 200 and sub_bar.current_value == 49
+    assert last.labels_outdated and sub_bar.labels_outdated
+    assert last.progress_label.text() == initial_progress and last.frequency_label.text() == initial_rate
+
+    scroll_area.ensureWidgetVisible(last.progress_label)
+    app.processEvents()
+
+    assert last.in_view and not first.in_view
+    assert not last.labels_outdated and not sub_bar.labels_outdated
+    assert [part.strip() for part in last.progress_label.text().split('/')] == ['49.0', '200.0']
+    assert sub_bar.progress_label.text().split('/')[0].strip() == '49.0'
+    scroll_area.close()
+
+
+def test_collapsed_sub_bars_are_not_formatted():
+    scroll_area, (pbar,) = create_window(1)
+    sub_bar = pbar.get_sub_bar(scroll_area.widget().layout(), 1)
+    pbar.toggle_sub_bars()
+    sub_bar.set_value(3)
+    assert sub_bar.labels_outdated
+
+    pbar.toggle_sub_bars()
+    assert not sub_bar.labels_outdated
+    scroll_area.close()
@@ -0,0 +1,52 @@
+from PyQt5 import QtCore
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.monitor import MonitorViewer, MonitorCommands
+from multiprogressbars.helpers.process_handler import ProcessHandler
+
+from tasks import sleep_loop
+
+
+def test_a_viewer_follows_a_headless_run_and_sends_it_commands():
+    mbar = Multibar(batch_size=2, headless=True, monitor_address=('127.0.0.1', 0), monitor_authkey=b'test')
+    for i in range(4):
+        mbar.add_task(sleep_loop, (40 if i != 3 else 400, 0.01), desc=f'task {i}', total=40)
+    viewer = MonitorViewer(mbar._mbar.monitor.address, b'test')
+    seen = dict()
+
+    def attached():
+        seen['names'] = {pid: pbar.task_name for pid, pbar in viewer.pbars.items()}
+        viewer.send_command(MonitorCommands.cancel_task, 3)
+
+    QtCore.QTimer.singleShot(300, attached)
+    results, failed = mbar.get()
+    # the last updates are published after the run has finished
+    deadline = QtCore.QDeadlineTimer(2000)
+    while viewer.pbars[2].value() < 40 and not deadline.hasExpired():
+        mbar._mbar.app.processEvents()
+        QtCore.QThread.msleep(10)
+    values = {pid: pbar.value() for pid, pbar in viewer.pbars.items()}
+    mbar.close()
+    viewer.scroll_area.close()
+
+    assert seen['names'] == {i: f'task {i}' for i in range(4)}
+    assert failed == {3: ProcessHandler.CANCELLED} and sorted(results) == [0, 1, 2]
+    assert values[0] == values[1] == values[2] == 40
+
+
+def test_a_viewer_attaching_late_gets_a_snapshot():
+    mbar = Multibar(batch_size=2, headless=True, monitor_address=('127.0.0.1', 0), monitor_authkey=b'test')
+    for i in range(2):
+        mbar.add_task(sleep_loop, (10, 0.01), desc=f'task {i}', total=10)
+    results, failed = mbar.get()
+    viewer = MonitorViewer(mbar._mbar.monitor.address, b'test')
+    deadline = QtCore.QDeadlineTimer(2000)
+    while len(viewer.pbars) < 2 and not deadline.hasExpired():
+        mbar._mbar.app.processEvents()
+        QtCore.QThread.msleep(10)
+    names = {pid: pbar.task_name for pid, pbar in viewer.pbars.items()}
+    mbar.close()
+    viewer.scroll_area.close()
+
+    assert failed == {}
+    assert names == {0: 'task 0', 1: 'task 1'}
@@ -0,0 +1,80 @@
+import time
+
+from PyQt5 import QtCore
+
+from multiprogressbars.pipeline import Pipeline
+from multiprogressbars.helpers.process_handler import ProcessHandler
+
+
+def square(x, pbar=None):
+    for _ in pbar(range(5)):
+        time.sleep(0.001)
+    return x * x
+
+
+def write(x, pbar=None):
+    if x == 49:
+        raise ValueError(f'cannot write {x}')
+    time.sleep(0.002)
+    return f'wrote {x}'
+
+
+def test_items_stream_through_the_stages_in_bounded_memory():
+    pipeline = Pipeline(headless=True)
+    pipeline.add_stage(square, workers=2, total=5)
+    pipeline.add_stage(write, workers=2, executor=Pipeline.ThreadExecutor, queue_size=2)
+    core = pipeline._pipeline
+    peak = dict(pbars=0, tasks=0, store=0)
+
+    def probe():
+        peak['pbars'] = max(peak['pbars'], len(core.pbars))
+        peak['tasks'] = max(peak['tasks'], len(core.tasks))
+        peak['store'] = len(core.store)
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(probe)
+    timer.start(1)
+    results, failed = pipeline.run(range(100))
+    timer.stop()
+    probe()
+    pipeline.close()
+
+    assert results == {i: f'wrote {i * i}' for i in range(100) if i != 7}
+    assert failed == {7: (1, ProcessHandler.EXCEPTION_RAISED)}
+    # the stage bars stay, the tasks and bars of the finished items are released
+    assert sorted(core.pbars) == [stage.pid for stage in core.stages]
+    assert len(core.tasks) == 0 and len(core.task_stage) == 0
+    # bounded by the items in flight (workers and queues of both stages), not by the 200 tasks run
+    assert peak['pbars'] <= 2 + 2 * 4 + 2
+    assert peak['store'] <= 2 + 2 * 4 + 2
+    assert [core.store.value[stage.pid] for stage in core.stages] == [100, 99]
+
+
+def slow_square(x, pbar=None):
+    time.sleep(0.05)
+    return x * x
+
+
+def test_a_drain_finishes_the_items_started_and_takes_no_more():
+    pipeline = Pipeline(headless=True)
+    pipeline.add_stage(slow_square, workers=2, queue_size=2)
+    pipeline.add_stage(slow_square, workers=2, queue_size=2)
+    core = pipeline._pipeline
+    closed = dict()
+
+    def close():
+        start = time.time()
+        pipeline.close('drain', timeout=5)
+        closed['time'] = time.time() - start
+        core.app.quit()
+
+    QtCore.QTimer.singleShot(300, close)
+    results, failed = pipeline.run(range(1000))
+
+    # only the items in the stages when the drain began are finished, well within the timeout
+    assert closed['time'] < 1
+    assert core.items_fed < 30
+    assert len(results) + len(failed) <= core.items_fed
+    assert all(results[i] == i ** 4 for i in results)
+    # the items drained out of the first stage do not enter the second
+    assert all(failure == (1, ProcessHandler.CANCELLED) for failure in failed.values())
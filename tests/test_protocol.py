@@ -0,0 +1,32 @@
+import pytest
+
+from multiprogressbars.helpers.protocol import Messages, FrameWriter, MAX_TEXT_LENGTH, encode_record, read_frame
+
+
+def test_a_record_round_trips():
+    assert list(read_frame(encode_record(Messages.value, 2.5, 3, 1))) == [(Messages.value, 3, 1, 2.5)]
+    assert list(read_frame(encode_record(Messages.name, 'løad 🙂', 70000))) == [(Messages.name, 70000, 0, 'løad 🙂')]
+
+
+def test_a_frame_holds_the_records_of_several_tasks_and_bars():
+    records = [(Messages.name, 0, 0, 'task'), (Messages.total, 0, 0, 10.0), (Messages.value, 0, 0, 4.0),
+               (Messages.name, 0, 2, ''), (Messages.value, 5, 2, 1e12), (Messages.state, 6, 0, -2.0)]
+    frame = FrameWriter()
+    for opcode, task_id, bar_index, value in records:
+        frame.add(opcode, value, task_id, bar_index)
+    assert len(frame) > 0
+
+    assert list(read_frame(frame.take())) == records
+    # taking the frame empties the writer
+    assert len(frame) == 0 and frame.take() == b''
+
+
+def test_long_text_is_truncated():
+    (record,) = read_frame(encode_record(Messages.name, 'x' * (MAX_TEXT_LENGTH + 10)))
+    assert record[3] == 'x' * MAX_TEXT_LENGTH
+
+
+@pytest.mark.parametrize('value', [None, 3, True])
+def test_names_are_sent_as_text(value):
+    (record,) = read_frame(encode_record(Messages.name, value))
+    assert record[3] == str(value)
@@ -0,0 +1,104 @@
+import operator
+import os
+import time
+
+from multiprogressbars.multibar import Multibar
+
+
+def visit(items, delay, pbar=None):
+    visited = []
+    for item in items:
+        time.sleep(delay)
+        visited.append((item, os.getpid()))
+    return visited
+
+
+def square_sum(items, pbar=None):
+    return sum(item * item for item in items)
+
+
+def test_the_range_is_split_onto_idle_workers():
+    mbar = Multibar(batch_size=3, headless=True)
+    task = mbar.add_range_task(visit, 0, 60, reduce=operator.add, func_args=(0.02,))
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {}
+    # every item is visited once, and the chunks' results are combined in the order of the range
+    assert [item for item, _ in results[task]] == list(range(60))
+    assert len({worker for _, worker in results[task]}) > 1
+
+
+def test_without_reduce_the_result_is_the_chunks_results():
+    mbar = Multibar(batch_size=3, headless=True)
+    task = mbar.add_range_task(visit, 10, 50, func_args=(0.02,), min_chunk_size=5)
+    results, failed = mbar.get()
+    mbar.close()
+
+    chunks = [[item for item, _ in chunk] for chunk in results[task]]
+    assert failed == {}
+    assert len(chunks) > 1
+    assert [item for chunk in chunks for item in chunk] == list(range(10, 50))
+    assert all(len(chunk) >= 5 for chunk in chunks)
+
+
+def test_the_result_equals_the_serial_result():
+    mbar = Multibar(batch_size=2, headless=True)
+    task = mbar.add_range_task(square_sum, 0, 1000, reduce=operator.add)
+    other = mbar.add_task(square_sum, (range(10),))
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {}
+    assert results[task] == square_sum(range(1000))
+    assert results[other] == square_sum(range(10))
+
+
+def visit_with_pbar(items, pbar=None):
+    # the usual idiom, which would report the absolute items as the value
+    visited = []
+    for item in pbar(items):
+        time.sleep(0.01)
+        visited.append(item)
+    return visited
+
+
+def test_the_merged_bar_counts_the_items_of_all_chunks():
+    mbar = Multibar(batch_size=3, headless=True)
+    core = mbar._mbar
+    reported = []
+    original_update_value = core.update_value
+
+    def update_value(pid, value, exit_code=None):
+        if exit_code is None:
+            reported.append(value)
+        original_update_value(pid, value, exit_code)
+
+    core.update_value = update_value
+    task = mbar.add_range_task(visit_with_pbar, 100, 160, reduce=operator.add)
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {} and results[task] == list(range(100, 160))
+    assert 0 < max(reported) <= 60
+
+
+def test_the_reduce_is_part_of_the_journal_key(tmp_path):
+    mbar = Multibar(batch_size=2, headless=True, cache_dir=str(tmp_path))
+    summed = mbar.add_range_task(square_sum, 0, 100, reduce=operator.add)
+    chunks = mbar.add_range_task(square_sum, 0, 100)
+    results, failed = mbar.get()
+    mbar.close()
+
+    mbar = Multibar(batch_size=2, headless=True, cache_dir=str(tmp_path))
+    replayed = mbar.add_range_task(square_sum, 0, 100, reduce=operator.add)
+    maximum = mbar.add_range_task(square_sum, 0, 100, reduce=max)
+    journaled = set(mbar._mbar.results)
+    replayed_results, _ = mbar.get()
+    mbar.close()
+
+    assert results[summed] == square_sum(range(100)) and sum(results[chunks]) == results[summed]
+    # only the task with the same reduce is replayed from the journal
+    assert journaled == {replayed}
+    assert replayed_results[replayed] == results[summed]
+    assert replayed_results[maximum] <= results[summed]
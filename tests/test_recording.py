@@ -0,0 +1,71 @@
+from PyQt5 import QtCore
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.protocol import Messages, read_frame
+from multiprogressbars.helpers.recording import EventRecorder, read_recording
+from multiprogressbars.helpers.replay_core import ReplayCore
+from multiprogressbars.helpers.task_store import TaskStore
+
+from tasks import sleep_loop
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    path = tmp_path / 'run.rec'
+    recorder = EventRecorder(path, resolution=0)
+    recorder.record(Messages.name, 0, 'first')
+    recorder.record(Messages.total, 0, 10)
+    recorder.record(Messages.state, 1, TaskStore.ON_HOLD)
+    recorder.close()
+
+    records = [record for _, frame in read_recording(path) for record in read_frame(frame)]
+    assert records == [(Messages.name, 0, 0, 'first'), (Messages.total, 0, 0, 10), (Messages.state, 1, 0, -3)]
+
+
+def test_a_truncated_recording_ends_at_its_last_complete_frame(tmp_path):
+    path = tmp_path / 'run.rec'
+    recorder = EventRecorder(path, resolution=0)
+    recorder.record(Messages.value, 0, 1)
+    recorder.record(Messages.value, 0, 2)
+    recorder.close()
+    with open(path, 'r+b') as f:
+        f.truncate(path.stat().st_size - 1)
+
+    assert len(list(read_recording(path))) == 1
+
+
+def follow_states(core):
+    transitions = []
+    set_task_state = core.set_task_state
+
+    def record_transition(pid, state):
+        transitions.append((pid, state))
+        set_task_state(pid, state)
+
+    core.set_task_state = record_transition
+    return transitions
+
+
+def test_a_replay_goes_through_the_same_states_as_the_run(tmp_path):
+    path = tmp_path / 'run.rec'
+    mbar = Multibar(batch_size=3, headless=True, record_path=path)
+    for _ in range(5):
+        mbar.add_task(sleep_loop, (30, 0.01), total=30)
+    live = follow_states(mbar._mbar)
+    QtCore.QTimer.singleShot(100, lambda: mbar._mbar.set_num_proceses(1))
+    QtCore.QTimer.singleShot(250, lambda: mbar._mbar.set_num_proceses(3))
+    results, failed = mbar.get()
+    live_values = list(mbar._mbar.store.value)
+    mbar.close()
+
+    replay = ReplayCore(path, speed=None, headless=True, quit_on_finished=True)
+    replayed = follow_states(replay)
+    replay.begin_processing()
+    replay_values = list(replay.store.value)
+    replay_states = list(replay.store.state)
+    replay.close()
+
+    assert len(results) == 5 and failed == {}
+    assert (0, TaskStore.RUNNING) in live and any(state == TaskStore.ON_HOLD for _, state in live)
+    assert replayed == live
+    assert replay_values == live_values
+    assert replay_states == [0] * 5
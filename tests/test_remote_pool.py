@@ -0,0 +1,39 @@
+import os
+import time
+from multiprocessing import Process
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.remote_pool import run_agent, AgentPipe
+
+
+def report_progress(count, pbar=None):
+    for _ in pbar(range(count), desc='remote', total=count):
+        time.sleep(0.002)
+    # the agent's BarUpdater must send its frames over the agent's connection
+    return pbar._root is pbar and isinstance(pbar._pipe, AgentPipe), os.getpid()
+
+
+def test_agents_report_progress_over_their_connection():
+    mbar = Multibar(batch_size=2, headless=True, remote_address=('127.0.0.1', 0), authkey=b'test')
+    agents = [Process(target=run_agent, args=(mbar._mbar.pool.address, b'test'), daemon=True) for _ in range(2)]
+    for agent in agents:
+        agent.start()
+    pids = [mbar.add_task(report_progress, (100,)) for _ in range(3)]
+    values = {pid: [] for pid in pids}
+    for pid in pids:
+        mbar._mbar.tasks[pid].updateValueSignal.connect(lambda pid, value: values[pid].append(value))
+
+    results, failed = mbar.get()
+    mbar.close()
+    for agent in agents:
+        agent.join(5)
+
+    assert failed == {}
+    for pid in pids:
+        relayed, agent_pid = results[pid]
+        assert relayed
+        assert agent_pid != os.getpid()
+        # the name, total and values only reach the scheduler through the relayed frames
+        assert mbar._mbar.pbars[pid].task_name == 'remote'
+        assert mbar._mbar.store.total[pid] == 100
+        assert len(values[pid]) > 1 and max(values[pid]) >= 99
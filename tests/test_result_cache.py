@@ -0,0 +1,106 @@
+import threading
+
+from multiprogressbars.helpers.result_cache import ResultCache
+
+
+def define(source, **global_values):
+    """ Define 'task' from its source, as if it had been edited in the module 'tasks' """
+    namespace = dict(__name__='tasks', **global_values)
+    exec(source, namespace)
+    return namespace['task']
+
+
+def get_key(source, args=(1,), **global_values):
+    return ResultCache.get_key(define(source, **global_values), args, dict())
+
+
+BASE = '''
+def task(x, scale=2):
+    return x * scale + 1
+'''
+
+
+def test_key_is_stable_for_the_same_function_and_arguments():
+    assert get_key(BASE) == get_key(BASE)
+    assert get_key(BASE, args=(1,)) != get_key(BASE, args=(2,))
+
+
+def test_key_changes_with_the_bytecode_constants_and_defaults():
+    assert get_key(BASE) != get_key(BASE.replace('x * scale', 'x - scale'))
+    assert get_key(BASE) != get_key(BASE.replace('+ 1', '+ 2'))
+    assert get_key(BASE) != get_key(BASE.replace('scale=2', 'scale=3'))
+    kwdefaults = '''
+def task(x, *, scale=2):
+    return x * scale
+'''
+    assert get_key(kwdefaults) != get_key(kwdefaults.replace('scale=2', 'scale=3'))
+
+
+def test_key_changes_with_nested_functions():
+    source = '''
+def task(x):
+    def inner(y):
+        return y + 1
+    return inner(x)
+'''
+    assert get_key(source) != get_key(source.replace('y + 1', 'y + 2'))
+
+
+def test_key_changes_with_the_closure():
+    source = '''
+def make(offset):
+    def task(x):
+        return x + offset
+    return task
+'''
+    namespace = dict(__name__='tasks')
+    exec(source, namespace)
+    assert (ResultCache.get_key(namespace['make'](1), (1,), dict()) ==
+            ResultCache.get_key(namespace['make'](1), (1,), dict()))
+    assert (ResultCache.get_key(namespace['make'](1), (1,), dict()) !=
+            ResultCache.get_key(namespace['make'](2), (1,), dict()))
+
+
+def test_key_changes_with_global_values_and_helper_functions():
+    source = '''
+def task(x):
+    return helper(x) * SCALE
+'''
+    helper = define('''
+def task(x):
+    return x + 1
+''')
+    edited_helper = define('''
+def task(x):
+    return x + 2
+''')
+    assert get_key(source, SCALE=2, helper=helper) == get_key(source, SCALE=2, helper=helper)
+    assert get_key(source, SCALE=2, helper=helper) != get_key(source, SCALE=3, helper=helper)
+    assert get_key(source, SCALE=2, helper=helper) != get_key(source, SCALE=2, helper=edited_helper)
+
+
+def test_recursive_functions_can_be_keyed():
+    source = '''
+def task(x):
+    return 1 if x <= 1 else x * task(x - 1)
+'''
+    assert get_key(source) is not None
+
+
+def test_unpicklable_arguments_and_upstream_tasks_are_not_cached():
+    assert get_key(BASE, args=(threading.Lock(),)) is None
+    assert ResultCache.get_key(define(BASE), (1,), dict(), upstream_keys=[None]) is None
+
+
+def test_results_persist_and_the_least_recently_used_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == (True, 1)
+    cache.put('c', 3)
+    # 'b' was the least recently used
+    assert cache.get('b') == (False, None)
+
+    reopened = ResultCache(str(tmp_path), max_entries=2)
+    assert reopened.get('a') == (True, 1)
+    assert reopened.get('c') == (True, 3)
@@ -0,0 +1,134 @@
+import time
+
+import pytest
+from PyQt5 import QtCore
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.task_store import TaskStore
+
+from tasks import sleep_loop
+
+
+def test_raising_the_number_of_processes_resumes_all_held_tasks():
+    mbar = Multibar(batch_size=3, headless=True)
+    for _ in range(6):
+        mbar.add_task(sleep_loop, (60, 0.01), total=60)
+    core = mbar._mbar
+    seen = dict()
+
+    def lower():
+        core.set_num_proceses(1)
+        seen['held'] = len(core.on_hold_tasks)
+
+    def raise_():
+        core.set_num_proceses(3)
+        seen['held after'] = len(core.on_hold_tasks)
+        seen['running after'] = len(core.running_tasks)
+        seen['states'] = sorted(core.store.state[pid] for pid in core.running_tasks)
+
+    QtCore.QTimer.singleShot(150, lower)
+    QtCore.QTimer.singleShot(300, raise_)
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert seen['held'] == 2
+    assert seen['held after'] == 0
+    assert seen['running after'] == 3
+    assert seen['states'] == [TaskStore.RUNNING] * 3
+    assert failed == {} and len(results) == 6
+
+
+def square(x, pbar=None):
+    return x * x
+
+
+def add_upstream(pbar=None, upstream_results=None):
+    return sum(upstream_results.values())
+
+
+def fail(pbar=None):
+    raise ValueError('failed on purpose')
+
+
+def test_dependent_tasks_get_the_results_of_their_dependencies():
+    mbar = Multibar(batch_size=2, headless=True)
+    squares = [mbar.add_task(square, (x,)) for x in range(4)]
+    total = mbar.add_task(add_upstream, depends_on=squares)
+    doubled = mbar.add_task(add_upstream, depends_on=[total, total])
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {}
+    assert results[total] == 0 + 1 + 4 + 9
+    assert results[doubled] == 14
+
+
+def test_failures_propagate_to_the_dependents_only():
+    mbar = Multibar(batch_size=2, headless=True)
+    failing = mbar.add_task(fail)
+    fine = mbar.add_task(square, (3,))
+    child = mbar.add_task(add_upstream, depends_on=[failing, fine])
+    grandchild = mbar.add_task(add_upstream, depends_on=[child])
+    independent = mbar.add_task(add_upstream, depends_on=[fine])
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert results == {fine: 9, independent: 9}
+    assert failed == {failing: ProcessHandler.EXCEPTION_RAISED, child: ProcessHandler.DEPENDENCY_FAILED,
+                      grandchild: ProcessHandler.DEPENDENCY_FAILED}
+
+
+def test_only_earlier_tasks_can_be_depended_on():
+    mbar = Multibar(batch_size=1, headless=True)
+    first = mbar.add_task(square, (2,))
+    with pytest.raises(ValueError):
+        mbar.add_task(square, (3,), depends_on=[first + 1])
+    mbar.close()
+
+
+def test_tasks_start_in_the_order_they_become_ready():
+    mbar = Multibar(batch_size=1, headless=True)
+    core = mbar._mbar
+    parse = [mbar.add_task(square, (i,)) for i in range(2)]
+    transform = [mbar.add_task(add_upstream, depends_on=[pid]) for pid in parse]
+    cancelled = mbar.add_task(square, (5,))
+    last = mbar.add_task(square, (6,))
+    core._cancel_task(cancelled)
+
+    started = [core.next_ready_task(), core.next_ready_task()]
+    core.end_task(parse[1])
+    started += [core.next_ready_task(), core.next_ready_task(), core.next_ready_task()]
+    mbar.close()
+
+    # the cancelled task is skipped, and a transform only starts once its parse has finished
+    assert started == [parse[0], parse[1], last, transform[1], None]
+    assert list(core.pending_tasks) == []
+
+
+def benchmark_dag_dispatch(num_pairs=3000, batch_size=16):
+    """
+    Time dispatching interleaved parse -> transform pairs, without running them (run as a script).
+    """
+    mbar = Multibar(batch_size=1, headless=True)
+    core = mbar._mbar
+    for i in range(num_pairs):
+        parse = mbar.add_task(square, (i,))
+        mbar.add_task(add_upstream, depends_on=[parse])
+    t0 = time.perf_counter()
+    while True:
+        # a batch of the ready tasks is started, then finishes
+        batch = [pid for pid in (core.next_ready_task() for _ in range(batch_size)) if pid is not None]
+        if len(batch) == 0:
+            break
+        for pid in batch:
+            core.results[pid] = 0
+            core.end_task(pid)
+    elapsed = time.perf_counter() - t0
+    mbar.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    for num_pairs in [1000, 3000]:
+        print(f'{num_pairs} parse -> transform pairs: {benchmark_dag_dispatch(num_pairs):.3f} s dispatching')
@@ -0,0 +1,30 @@
+import os
+
+from multiprogressbars.multibar import MultibarSession
+
+
+def scaled_pid(scale, pbar=None):
+    for _ in pbar(range(3)):
+        pass
+    return scale, os.getpid()
+
+
+def test_batches_share_the_pool_and_only_return_their_own_results():
+    with MultibarSession(batch_size=2, headless=True) as session:
+        pool = session._mbar.pool
+        for scale in range(3):
+            session.add_task(scaled_pid, (scale,))
+        first, first_failed = session.get()
+
+        session.add_task(scaled_pid, (10,))
+        second, second_failed = session.get()
+        bars = len(session._mbar.pbars)
+
+        assert session._mbar.pool is pool
+
+    assert first_failed == {} and second_failed == {}
+    assert sorted(result[0] for result in first.values()) == [0, 1, 2]
+    # the second batch starts again from task 0, with the bars of the first cleared
+    assert list(second) == [0] and second[0][0] == 10 and bars == 1
+    workers = {result[1] for result in list(first.values()) + list(second.values())}
+    assert len(workers) <= 2
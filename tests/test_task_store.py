@@ -0,0 +1,124 @@
+import time
+
+from PyQt5 import QtCore
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.process_handler import ProcessHandler
+from multiprogressbars.helpers.task_store import TaskStore
+
+
+def test_finished_tasks_are_indexed_by_state():
+    store = TaskStore()
+    pids = [store.add(10) for _ in range(5)]
+    store.set_state(pids[1], TaskStore.RUNNING)
+    store.set_state(pids[2], TaskStore.ON_HOLD)
+    for pid, state in [(4, ProcessHandler.SUCESSFUL), (3, ProcessHandler.CANCELLED), (0, ProcessHandler.SUCESSFUL)]:
+        store.set_state(pid, TaskStore.RUNNING)
+        store.set_state(pid, state)
+
+    assert store.get_pids(ProcessHandler.SUCESSFUL) == [0, 4]
+    assert store.get_pids(ProcessHandler.SUCESSFUL, ProcessHandler.CANCELLED) == [0, 3, 4]
+    assert store.get_pids(ProcessHandler.TIMED_OUT) == []
+    assert store.max_finished == 4
+
+
+def test_finished_tasks_keep_their_state():
+    store = TaskStore()
+    pid = store.add(10)
+    store.set_state(pid, TaskStore.RUNNING)
+    store.set_state(pid, ProcessHandler.CANCELLED)
+    store.set_state(pid, ProcessHandler.SUCESSFUL)
+
+    assert store.state[pid] == ProcessHandler.CANCELLED
+    assert store.get_pids(ProcessHandler.SUCESSFUL) == []
+    assert store.max_finished == -1
+
+
+def test_a_released_row_is_reused_as_pending():
+    store = TaskStore()
+    first = store.add(10)
+    store.add(10)
+    store.set_state(first, ProcessHandler.SUCESSFUL)
+
+    assert store.add(5, first) == first
+    assert store.total[first] == 5 and store.value[first] == 0
+    assert store.state[first] == TaskStore.PENDING
+    assert store.get_pids(ProcessHandler.SUCESSFUL) == []
+    assert store.add(5) == 2
+
+
+def test_expected_durations_add_the_remaining_time_to_the_time_so_far():
+    store = TaskStore()
+    for _ in range(4):
+        store.add(100)
+    store.set_state(1, TaskStore.RUNNING)
+    store.set_state(3, TaskStore.RUNNING)
+    store.start_time[1] -= 2
+    store.last_updated[1] = time.time()
+    store.rate[1] = 10
+    store.value[1] = 50
+
+    durations = store.get_expected_durations([1, 3])
+    assert sorted(durations) == [1, 3]
+    # 2 s so far, and 50 items left at 10 per second
+    assert abs(durations[1] - 7) < 0.1
+    # no rate yet, so no remaining time
+    assert durations[3] < 0.1
+
+
+def test_the_elapsed_time_runs_to_the_last_update():
+    store = TaskStore()
+    pid = store.add(100)
+    assert store.get_elapsed_time(pid) == 0
+    store.set_state(pid, TaskStore.RUNNING)
+    store.start_time[pid] -= 3
+    store.set_value(pid, 10)
+    store.set_state(pid, ProcessHandler.SUCESSFUL)
+
+    assert abs(store.get_elapsed_time(pid) - 3) < 0.1
+
+
+def ignore_interruptions(seconds, pbar=None):
+    time.sleep(seconds)
+    return 'done'
+
+
+def test_a_cancelled_task_stays_cancelled_when_its_worker_returns():
+    mbar = Multibar(batch_size=1, headless=True)
+    task = mbar.add_task(ignore_interruptions, (0.5,))
+    QtCore.QTimer.singleShot(100, lambda: mbar._mbar._cancel_task(task))
+    results, failed = mbar.get()
+    # the handler reports the task's return
+    deadline = time.time() + 5
+    while mbar._mbar.tasks[task].isRunning() and time.time() < deadline:
+        mbar._mbar.app.processEvents()
+        time.sleep(0.01)
+    mbar._mbar.app.processEvents()
+    mbar.close()
+
+    assert results == {} and failed == {task: ProcessHandler.CANCELLED}
+    assert task not in mbar._mbar.results
+    assert mbar._mbar.store.state[task] == ProcessHandler.CANCELLED
+
+
+def benchmark_store_queries(num_finished=100000, num_running=16, repeats=100):
+    """
+    Time the scheduler's queries with many finished tasks and a few running ones (run as a script).
+    """
+    store = TaskStore()
+    for pid in range(num_finished + num_running):
+        store.add(100)
+        store.set_state(pid, TaskStore.RUNNING)
+        if pid < num_finished:
+            store.set_state(pid, ProcessHandler.SUCESSFUL)
+    # as followed by the scheduler
+    running_tasks = dict.fromkeys(range(num_finished, num_finished + num_running))
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        store.get_expected_durations(running_tasks)
+    return (time.perf_counter() - t0) / repeats
+
+
+if __name__ == "__main__":
+    for num_finished in [1000, 10000, 100000]:
+        print(f'{num_finished} finished tasks: {1e6 * benchmark_store_queries(num_finished):.1f} us per query')
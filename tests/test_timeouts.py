@@ -0,0 +1,142 @@
+import os
+import time
+
+from PyQt5 import QtCore
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.process_handler import ProcessHandler
+
+from tasks import sleep_loop
+
+
+def hang(seconds, pbar=None):
+    # never reports progress, so never sees the interruption request
+    time.sleep(seconds)
+    return seconds
+
+
+def worker_pid(pbar=None):
+    return os.getpid()
+
+
+def test_the_stuck_worker_of_a_timed_out_task_is_replaced(monkeypatch):
+    monkeypatch.setattr(ProcessHandler, 'stop_timeout', 0.2)
+    mbar = Multibar(batch_size=1, headless=True)
+    mbar.add_task(hang, (30,), timeout=0.3)
+    later = mbar.add_task(worker_pid)
+    initial_workers = [worker.pid for worker in mbar._mbar.pool._pool]
+    start = time.time()
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {0: ProcessHandler.TIMED_OUT}
+    # the later task ran on the worker that replaced the stuck one, without waiting for the hung task
+    assert results[later] not in initial_workers
+    assert time.time() - start < 10
+
+
+def test_the_slot_of_a_timed_out_task_stays_busy_until_its_worker_stops(monkeypatch):
+    monkeypatch.setattr(ProcessHandler, 'stop_timeout', 0.2)
+    mbar = Multibar(batch_size=2, headless=True)
+    mbar.add_task(hang, (30,), timeout=0.3)
+    core = mbar._mbar
+    seen = dict()
+    original_end_task = core.end_task
+
+    def end_task(pid, exit_code=ProcessHandler.SUCESSFUL):
+        original_end_task(pid, exit_code)
+        if exit_code == ProcessHandler.TIMED_OUT:
+            seen['busy'] = core.get_busy_workers()
+
+    core.end_task = end_task
+    results, failed = mbar.get()
+    # the worker is released once killed
+    deadline = time.time() + 5
+    while core.get_busy_workers() > 0 and time.time() < deadline:
+        core.app.processEvents()
+        time.sleep(0.01)
+    mbar.close()
+
+    assert failed == {0: ProcessHandler.TIMED_OUT}
+    assert seen['busy'] == 1
+    assert core.get_busy_workers() == 0
+
+
+def slow_first_run(marker, pbar=None):
+    # the first run of the task straggles, its duplicate doesn't
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return 'duplicate'
+    for _ in pbar(range(200)):
+        time.sleep(0.1)
+    return 'original'
+
+
+def quick(pbar=None):
+    time.sleep(0.05)
+    return 'quick'
+
+
+def test_the_duplicate_of_a_straggler_provides_its_result(tmp_path):
+    mbar = Multibar(batch_size=2, headless=True, speculative=True, straggler_factor=2.0,
+                    straggler_check_frequency=0.05)
+    straggler = mbar.add_task(slow_first_run, (str(tmp_path / 'started'),))
+    quick_tasks = [mbar.add_task(quick) for _ in range(3)]
+    start = time.time()
+    results, failed = mbar.get()
+    core = mbar._mbar
+    mbar.close()
+
+    assert failed == {}
+    assert results[straggler] == 'duplicate'
+    assert all(results[pid] == 'quick' for pid in quick_tasks)
+    assert core.store.state[straggler] == ProcessHandler.SUCESSFUL
+    # the original run was stopped rather than waited for
+    assert time.time() - start < 10
+
+
+def test_the_time_a_task_is_on_hold_does_not_count_towards_its_timeout():
+    mbar = Multibar(batch_size=2, headless=True)
+    longer = mbar.add_task(sleep_loop, (90, 0.02), total=90)
+    # 0.6 s of work, on hold until the longer task has finished
+    timed = mbar.add_task(sleep_loop, (30, 0.02), total=30, timeout=1.2)
+    core = mbar._mbar
+    held = dict()
+
+    def lower():
+        core.set_num_proceses(1)
+        held['tasks'] = list(core.on_hold_tasks)
+
+    QtCore.QTimer.singleShot(100, lower)
+    start = time.time()
+    results, failed = mbar.get()
+    elapsed = time.time() - start
+    mbar.close()
+
+    assert held['tasks'] == [timed]
+    assert failed == {}
+    assert results == {longer: 90, timed: 30}
+    # the held task took longer than its timeout
+    assert elapsed > 1.2 + 0.5
+
+
+def test_a_task_cancelled_while_on_hold_is_not_waited_for():
+    mbar = Multibar(batch_size=2, headless=True)
+    running = mbar.add_task(sleep_loop, (10, 0.02), total=10)
+    held = mbar.add_task(sleep_loop, (1000, 0.02), total=1000)
+    core = mbar._mbar
+
+    def lower_and_cancel():
+        core.set_num_proceses(1)
+        core._cancel_task(held)
+
+    QtCore.QTimer.singleShot(100, lower_and_cancel)
+    start = time.time()
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert results == {running: 10}
+    assert failed == {held: ProcessHandler.CANCELLED}
+    assert len(core.on_hold_tasks) == 0
+    assert time.time() - start < 10
@@ -0,0 +1,73 @@
+import os
+import time
+
+from multiprogressbars.multibar import Multibar
+from multiprogressbars.helpers.worker_context import WorkerContext
+
+
+def test_teardowns_run_in_reverse_order_once():
+    context = WorkerContext()
+    calls = []
+    context.add_teardown(calls.append, 'first')
+    context.add_teardown(calls.append, 'second')
+    context.close()
+    context.close()
+
+    assert calls == ['second', 'first']
+    assert context.closed
+
+
+def test_a_failing_teardown_does_not_stop_the_others():
+    context = WorkerContext()
+    calls = []
+    context.add_teardown(calls.append, 'released')
+    context.add_teardown(lambda: 1 / 0)
+    context.close()
+
+    assert calls == ['released']
+    assert context.closed
+
+
+def load(context, directory):
+    context.loaded_by = os.getpid()
+    context.tasks_run = 0
+    context.add_teardown(lambda: open(os.path.join(directory, str(os.getpid())), 'w').close())
+
+
+def use_context(pbar=None):
+    pbar.context.tasks_run += 1
+    time.sleep(0.01)
+    return pbar.context.loaded_by, os.getpid(), pbar.context.tasks_run
+
+
+def test_tasks_share_the_context_made_by_their_workers_initializer(tmp_path):
+    mbar = Multibar(batch_size=2, headless=True, initializer=load, initargs=(str(tmp_path),))
+    for _ in range(6):
+        mbar.add_task(use_context)
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {}
+    assert all(loaded_by == worker for loaded_by, worker, _ in results.values())
+    # the tasks on a worker count up in its context
+    for worker in {worker for _, worker, _ in results.values()}:
+        counts = sorted(count for _, w, count in results.values() if w == worker)
+        assert counts == list(range(1, len(counts) + 1))
+
+
+def test_recycled_workers_tear_their_context_down(tmp_path):
+    mbar = Multibar(batch_size=1, headless=True, initializer=load, initargs=(str(tmp_path),), maxtasksperchild=1)
+    for _ in range(3):
+        mbar.add_task(use_context)
+    results, failed = mbar.get()
+    mbar.close()
+
+    assert failed == {}
+    assert all(count == 1 for _, _, count in results.values())
+    # the workers that ran a task exited cleanly before being replaced
+    workers = {str(worker) for _, worker, _ in results.values()}
+    deadline = time.time() + 5
+    while not workers <= set(os.listdir(tmp_path)) and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(workers) == 3
+    assert len(workers & set(os.listdir(tmp_path))) >= 2